@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -20,12 +21,17 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-j+)!k!e!ed3t#vjh1%9mpz6#ih*)=a2mri@ci(6cx18pr%ar#q'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-j+)!k!e!ed3t#vjh1%9mpz6#ih*)=a2mri@ci(6cx18pr%ar#q',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [
+    host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host
+]
 
 
 # Application definition
@@ -41,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'school.middleware.SamplingProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,7 +84,58 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests in long-lived workers
+        # (see gunicorn.conf.py); the dev server uses one thread per request.
+        'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Preforked workers need a shared cache so that invalidation done by one
+# worker is seen by the others; DJANGO_CACHE_LOCATION switches to a file cache.
+
+if os.environ.get('DJANGO_CACHE_LOCATION'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_LOCATION'],
+        }
     }
+    # cache.add() is not atomic in the file cache, so cross-worker locks
+    # (school.locks.WorkerLock) use lock files next to it instead.
+    SCHOOL_LOCK_DIR = os.path.join(os.environ['DJANGO_CACHE_LOCATION'], 'locks')
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+SYLLABUS_CACHE_TIMEOUT = 60 * 60
+ANALYTICS_CACHE_TIMEOUT = 5 * 60
+ANALYTICS_STALE_TIMEOUT = 60 * 60
+# Memory-mapped analytics snapshot shared by all workers (see school.snapshot).
+# Needs the shared cache above to know whether the snapshot is up to date.
+ANALYTICS_SNAPSHOT_PATH = os.environ.get('DJANGO_ANALYTICS_SNAPSHOT') or None
+ANALYTICS_SNAPSHOT_REBUILD_INTERVAL = 10
+# A snapshot that predates the latest write is still served for this long
+# while a worker rebuilds it.
+ANALYTICS_SNAPSHOT_MAX_STALENESS = ANALYTICS_SNAPSHOT_REBUILD_INTERVAL
+# Teacher and student names kept in each worker's memory (see school.dimensions).
+DIMENSION_CACHE_SIZE = 10_000
+
+
+# Request profiling
+# Profiles a sample of /api/ requests (or those sending a signed X-Profile-Token
+# header, see `manage.py profile_report --token`) into DIRECTORY.
+
+SCHOOL_PROFILER = {
+    'ENABLED': os.environ.get('DJANGO_PROFILER', '0') == '1',
+    'SAMPLE_RATE': float(os.environ.get('DJANGO_PROFILER_SAMPLE_RATE', 0)),
+    'DIRECTORY': BASE_DIR / 'profiles',
 }
 
 
@@ -0,0 +1,65 @@
+"""
+Production server settings for Smart Academy.
+
+    gunicorn --config gunicorn.conf.py
+
+Serves academy.wsgi with preforked (optionally threaded) workers, or
+academy.asgi with uvicorn workers when ACADEMY_INTERFACE=asgi. Each worker
+runs school.warmup after it boots, so it answers its first /api/ request
+with warm caches and an open database connection. The master builds the
+memory-mapped analytics snapshot (school.snapshot) before forking.
+"""
+
+import multiprocessing
+import os
+
+# DJANGO_DEBUG=0 below must not fall back to the development SECRET_KEY that
+# is committed to the repository: it signs sessions and X-Profile-Token.
+if not os.environ.get("DJANGO_SECRET_KEY"):
+    raise RuntimeError("Set DJANGO_SECRET_KEY before starting gunicorn.")
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "academy.settings")
+os.environ.setdefault("DJANGO_DEBUG", "0")
+os.environ.setdefault("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1")
+os.environ.setdefault("DJANGO_CONN_MAX_AGE", "600")
+os.environ.setdefault("DJANGO_CACHE_LOCATION", "/tmp/academy-cache")
+os.environ.setdefault("DJANGO_ANALYTICS_SNAPSHOT", "/tmp/academy-analytics.snapshot")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+keepalive = 5
+accesslog = "-"
+
+if os.environ.get("ACADEMY_INTERFACE", "wsgi") == "asgi":
+    wsgi_app = "academy.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "academy.wsgi:application"
+    worker_class = "gthread" if threads > 1 else "sync"
+
+# Load Django once in the master and fork it into the workers. Database
+# connections are opened after the fork, in post_worker_init.
+preload_app = True
+
+
+def on_starting(server):
+    # Build the analytics snapshot once in the master; the workers map it.
+    from django.db import connections
+    from school.snapshot import build_snapshot
+
+    try:
+        build_snapshot()
+    except Exception:
+        server.log.exception("Building the analytics snapshot failed")
+    finally:
+        connections.close_all()
+
+
+def post_worker_init(worker):
+    from school.warmup import warm_up, warm_up_thread_pool
+
+    warm_up()
+    if getattr(worker, "tpool", None) is not None:
+        warm_up_thread_pool(worker.tpool, worker.cfg.threads)
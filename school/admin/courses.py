@@ -34,7 +34,7 @@ class ReviewsCountFilter(admin.SimpleListFilter):
 @admin.register(Course)
 class CoursesAdmin(admin.ModelAdmin):
     list_display = ("title", "teacher__name", "avg_rating_display", "reviews_count")
-    list_filter = (TeacherNameFilter, ReviewsCountFilter)
+    list_filter = (TeacherNameFilter, ReviewsCountFilter, "is_archived")
     search_fields = ("title", "teacher__name")
     ordering = ("title",)
 
@@ -0,0 +1,203 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_max_age
+
+from .locks import WorkerLock
+from .singleflight import SingleFlight
+
+SYLLABUS_CACHE_TIMEOUT = getattr(settings, "SYLLABUS_CACHE_TIMEOUT", 60 * 60)
+ANALYTICS_CACHE_TIMEOUT = getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 5 * 60)
+# How long an expired or invalidated analytics response may still be served
+# while another worker recomputes it.
+ANALYTICS_STALE_TIMEOUT = getattr(settings, "ANALYTICS_STALE_TIMEOUT", 60 * 60)
+# Upper bound on one recomputation; the cross-worker lock expires after it.
+ANALYTICS_LOCK_TIMEOUT = getattr(settings, "ANALYTICS_LOCK_TIMEOUT", 30)
+# How long a worker without a stale copy waits for another worker's result
+# before computing it itself.
+ANALYTICS_LOCK_WAIT = getattr(settings, "ANALYTICS_LOCK_WAIT", 2)
+ANALYTICS_GENERATION_KEY = "school:analytics:generation"
+
+_analytics_flights = SingleFlight()
+
+
+def syllabus_key(course_id, generation):
+    return f"school:syllabus:{course_id}:{generation}"
+
+
+def syllabus_generation_key(course_id):
+    return f"school:syllabus:{course_id}:generation"
+
+
+def get_syllabi(course_ids):
+    """
+    Return ``(syllabi, generations)``: ``{course_id: syllabus}`` for the ids
+    that are already cached, and the current generation of every course.
+    Pass the generations to set_syllabi(), so a syllabus built before an
+    invalidation is stored under a generation nobody reads any more.
+    """
+    keys = {syllabus_generation_key(pk): pk for pk in course_ids}
+    generations = {keys[key]: value for key, value in get_generations(keys).items()}
+    syllabus_keys = {syllabus_key(pk, generation): pk for pk, generation in generations.items()}
+    syllabi = {syllabus_keys[key]: value for key, value in cache.get_many(syllabus_keys).items()}
+    return syllabi, generations
+
+
+def set_syllabi(syllabi, generations):
+    cache.set_many(
+        {syllabus_key(pk, generations[pk]): value for pk, value in syllabi.items()},
+        timeout=SYLLABUS_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_syllabi(*course_ids):
+    for pk in set(course_ids) - {None}:
+        bump_generation(syllabus_generation_key(pk))
+
+
+def get_generation(key):
+    """
+    Current value of a shared generation counter. Caches keyed by it are
+    invalidated at once by bumping it. Generations are only compared for
+    equality, and each one is a clock value, so an evicted counter never
+    comes back to an old value.
+    """
+    return get_generations([key])[key]
+
+
+def get_generations(keys):
+    """get_generation() for many keys, in one cache round trip when all exist."""
+    generations = cache.get_many(keys)
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        generations.update(cache.get_many(missing))
+    return generations
+
+
+def bump_generation(key):
+    # A fresh value rather than incr(): incr() reads then writes in the file
+    # cache, so two concurrent bumps could both store the same N + 1.
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def analytics_generation():
+    return get_generation(ANALYTICS_GENERATION_KEY)
+
+
+def invalidate_analytics():
+    bump_generation(ANALYTICS_GENERATION_KEY)
+
+
+def invalidate_analytics_on_commit(using=None):
+    """
+    Invalidate the analytics once the current transaction commits, queueing
+    at most one invalidation per transaction however many rows it changes.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    queued = getattr(connection, "school_analytics_invalidation", None)
+    # A rollback replaces run_on_commit, dropping the queued callback with it.
+    if queued is not None and queued[0] is connection.run_on_commit:
+        return
+
+    def invalidate():
+        connection.school_analytics_invalidation = None
+        invalidate_analytics()
+
+    if connection.in_atomic_block:
+        connection.school_analytics_invalidation = (connection.run_on_commit, invalidate)
+    transaction.on_commit(invalidate, using=using)
+
+
+def _fresh_content(entry, generation):
+    if entry is None:
+        return None
+    entry_generation, expires_at, content = entry
+    if entry_generation == generation and time.time() < expires_at:
+        return content
+    return None
+
+
+def _compute_analytics(key, generation, compute):
+    """
+    Recompute one analytics response for this worker and return its
+    ``(status, content)``. A WorkerLock lets a single worker run the query;
+    the others serve the stale entry when there is one, or wait briefly for
+    the winner's result. Only 200 responses are cached, for at most their
+    Cache-Control max-age.
+    """
+    lock = WorkerLock(f"{key}:lock", timeout=ANALYTICS_LOCK_TIMEOUT)
+    if not lock.acquire():
+        entry = cache.get(key)
+        if entry is not None:
+            return 200, entry[2]
+        deadline = time.monotonic() + ANALYTICS_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            content = _fresh_content(cache.get(key), generation)
+            if content is not None:
+                return 200, content
+        status, content, _ = compute()
+        return status, content
+
+    try:
+        status, content, max_age = compute()
+        if status == 200:
+            timeout = ANALYTICS_CACHE_TIMEOUT
+            if max_age is not None:
+                timeout = min(max_age, timeout)
+            cache.set(
+                key,
+                (generation, time.time() + timeout, content),
+                timeout=ANALYTICS_STALE_TIMEOUT,
+            )
+        return status, content
+    finally:
+        lock.release()
+
+
+def cached_analytics(name, form_class=None):
+    """
+    Cache the JSON body of an analytics view until the data changes or the
+    entry expires. Concurrent identical requests share one recomputation:
+    within a worker through SingleFlight, across workers through a
+    WorkerLock. Error responses are shared the same way but never cached.
+
+    With ``form_class`` the query string is validated first (400 on errors),
+    the view receives the cleaned values as ``filters`` and the cache key
+    includes the form's canonical ``cache_key()``.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = f"school:analytics:{name}"
+            if form_class is not None:
+                form = form_class(request.GET)
+                if not form.is_valid():
+                    return JsonResponse({"errors": form.errors}, status=400)
+                kwargs["filters"] = form.cleaned_data
+                key = f"{key}:{form.cache_key()}"
+            generation = analytics_generation()
+            status = 200
+            content = _fresh_content(cache.get(key), generation)
+            if content is None:
+
+                def compute():
+                    response = view(request, *args, **kwargs)
+                    return response.status_code, response.content, get_max_age(response)
+
+                status, content = _analytics_flights.do(
+                    f"{key}:{generation}",
+                    lambda: _compute_analytics(key, generation, compute),
+                )
+            return HttpResponse(content, status=status, content_type="application/json")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .cache import bump_generation, get_generation
+from .models import Student, Teacher
+
+DIMENSION_CACHE_SIZE = getattr(settings, "DIMENSION_CACHE_SIZE", 10_000)
+
+
+class NameCache:
+    """
+    Bounded LRU map of primary key to ``name`` for one model, held in process
+    memory. Hot queries select only foreign-key ids and resolve names here
+    instead of joining the model. Writes bump a generation counter in the
+    shared cache; every worker drops its copy when it sees a new generation.
+    """
+
+    def __init__(self, model, max_size=DIMENSION_CACHE_SIZE):
+        self.model = model
+        self.max_size = max_size
+        self.generation_key = f"school:dimensions:{model._meta.label_lower}"
+        self._names = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        bump_generation(self.generation_key)
+
+    def load(self):
+        """Fill the cache in one query with up to ``max_size`` names."""
+        generation = get_generation(self.generation_key)
+        names = self.model.objects.order_by("pk").values_list("pk", "name")
+        self._store(generation, names[: self.max_size], reset=True)
+
+    def resolve(self, ids):
+        """Return ``{id: name}`` for ``ids``, loading the misses in one query."""
+        generation = get_generation(self.generation_key)
+        found = {}
+        missing = []
+        with self._lock:
+            if generation != self._generation:
+                self._names.clear()
+                self._generation = generation
+            for pk in set(ids):
+                if pk in self._names:
+                    self._names.move_to_end(pk)
+                    found[pk] = self._names[pk]
+                elif pk is not None:
+                    missing.append(pk)
+        if missing:
+            loaded = dict(
+                self.model.objects.filter(pk__in=missing).values_list("pk", "name")
+            )
+            self._store(generation, loaded.items())
+            found.update(loaded)
+        return found
+
+    def _store(self, generation, names, reset=False):
+        with self._lock:
+            if reset:
+                self._names.clear()
+                self._generation = generation
+            elif generation != self._generation:
+                return
+            for pk, name in names:
+                self._names[pk] = name
+                self._names.move_to_end(pk)
+            while len(self._names) > self.max_size:
+                self._names.popitem(last=False)
+
+
+teacher_names = NameCache(Teacher)
+student_names = NameCache(Student)
@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from django import forms
+
+from .models import Rating
+
+# Largest primary key the database can store; bigger ids are rejected
+# before they reach a query.
+MAX_ID = 2**63 - 1
+
+
+class RatingForm(forms.Form):
+    """
+    One submitted rating. Course and student are plain ids so a batch can be
+    validated without a query per row; their existence is checked in bulk.
+    """
+
+    course = forms.IntegerField(min_value=1, max_value=MAX_ID)
+    student = forms.IntegerField(min_value=1, max_value=MAX_ID)
+    rating = forms.IntegerField(min_value=1, max_value=5)
+    comment = forms.CharField(required=False)
+
+    def to_rating(self):
+        data = self.cleaned_data
+        return Rating(
+            course_id=data["course"],
+            student_id=data["student"],
+            rating=data["rating"],
+            comment=data["comment"],
+        )
+
+
+class EnrollmentForm(forms.Form):
+    """One (course, student) pair of a bulk enrollment request."""
+
+    course = forms.IntegerField(min_value=1, max_value=MAX_ID)
+    student = forms.IntegerField(min_value=1, max_value=MAX_ID)
+
+    def to_pair(self):
+        return self.cleaned_data["course"], self.cleaned_data["student"]
+
+
+class TeacherFilterForm(forms.Form):
+    """Query parameters shared by the teacher analytics endpoints."""
+
+    MAX_LIMIT = 500
+
+    teacher_id = forms.IntegerField(required=False, min_value=1, max_value=MAX_ID)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=MAX_LIMIT)
+
+    def cache_key(self):
+        """
+        Canonical form of the cleaned parameters, so requests that mean the
+        same thing (``min_avg=3.50`` and ``min_avg=3.5``, reordered or unknown
+        parameters, explicit defaults) share one cache entry.
+        """
+        parts = []
+        for name, value in sorted(self.cleaned_data.items()):
+            if value is None:
+                continue
+            if isinstance(value, Decimal):
+                value = f"{value.normalize():f}"
+            parts.append(f"{name}={value}")
+        return "&".join(parts)
+
+
+class TopCoursesFilterForm(TeacherFilterForm):
+    DEFAULT_MIN_REVIEWS = 2
+    DEFAULT_MIN_AVG = Decimal("3.5")
+
+    min_reviews = forms.IntegerField(required=False, min_value=0)
+    min_avg = forms.DecimalField(required=False, min_value=0, max_value=5)
+    price_min = forms.DecimalField(required=False, min_value=0)
+    price_max = forms.DecimalField(required=False, min_value=0)
+
+    def clean_min_reviews(self):
+        value = self.cleaned_data["min_reviews"]
+        return self.DEFAULT_MIN_REVIEWS if value is None else value
+
+    def clean_min_avg(self):
+        value = self.cleaned_data["min_avg"]
+        return self.DEFAULT_MIN_AVG if value is None else value
+
+    def clean(self):
+        cleaned_data = super().clean()
+        price_min = cleaned_data.get("price_min")
+        price_max = cleaned_data.get("price_max")
+        if price_min is not None and price_max is not None and price_min > price_max:
+            raise forms.ValidationError("price_min must not be greater than price_max.")
+        return cleaned_data
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.cache import cache
+
+SCHOOL_LOCK_DIR = getattr(settings, "SCHOOL_LOCK_DIR", None)
+# Lock names are hashed onto this many lock files, so the directory stays
+# bounded however many distinct cache keys are locked.
+LOCK_STRIPES = 1024
+
+
+class WorkerLock:
+    """
+    Non-blocking lock shared by every worker on the host.
+
+    With SCHOOL_LOCK_DIR set it is an ``flock()`` on a lock file: acquiring
+    it is atomic, and the kernel releases it if the holder dies. Otherwise it
+    falls back to ``cache.add()``, which is atomic in LocMemCache (the lock
+    is then per process) but not in FileBasedCache; such a lock expires after
+    ``timeout`` seconds. Either way, release() only drops a lock still owned.
+    """
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        self._fd = None
+        self._token = None
+
+    def acquire(self):
+        if SCHOOL_LOCK_DIR and fcntl is not None:
+            os.makedirs(SCHOOL_LOCK_DIR, exist_ok=True)
+            fd = os.open(self._path(), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+        token = uuid.uuid4().hex
+        if cache.add(self.name, token, timeout=self.timeout):
+            self._token = token
+            return True
+        return False
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        elif self._token is not None:
+            # The lock may have expired and been taken by another worker.
+            if cache.get(self.name) == self._token:
+                cache.delete(self.name)
+            self._token = None
+
+    def _path(self):
+        digest = hashlib.sha1(self.name.encode()).digest()
+        stripe = int.from_bytes(digest[:4], "big") % LOCK_STRIPES
+        return os.path.join(SCHOOL_LOCK_DIR, f"{stripe:04d}.lock")
@@ -0,0 +1,86 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from school.models import ArchivedRating, Rating
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old ratings, or the ratings of archived courses, out of the "
+        "Rating table into ArchivedRating. Their contribution to the course "
+        "and teacher stats is folded into CourseRatingRollup first, so the "
+        "API returns the same results. Each batch commits on its own, so an "
+        "interrupted run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before",
+            help="Archive ratings created before this date or datetime (ISO 8601). "
+            "Ratings that predate the created_at column carry the time the "
+            "migration ran instead of their real creation time.",
+        )
+        parser.add_argument(
+            "--before-id",
+            type=int,
+            help="Archive ratings with an id below this one. Ids grow over time, "
+            "so this also reaches ratings without a real created_at.",
+        )
+        parser.add_argument(
+            "--archived-courses",
+            action="store_true",
+            help="Archive every rating of courses marked is_archived.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches, to leave room for other writers.",
+        )
+
+    def handle(self, *args, **options):
+        criteria = Q()
+        if options["before"]:
+            criteria |= Q(created_at__lt=self._parse_cutoff(options["before"]))
+        if options["before_id"] is not None:
+            criteria |= Q(id__lt=options["before_id"])
+        if options["archived_courses"]:
+            criteria |= Q(course__is_archived=True)
+        if not criteria:
+            raise CommandError("Pass --before, --before-id, --archived-courses or a combination.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        archived = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Rating.objects.filter(criteria).order_by("id")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                ArchivedRating.objects.archive(batch)
+            archived += len(batch)
+            self.stdout.write(f"Archived {archived} ratings (up to id {batch[-1].id})")
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {archived} ratings archived."))
+
+    def _parse_cutoff(self, value):
+        cutoff = parse_datetime(value)
+        if cutoff is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f"Invalid --before value {value!r}.")
+            cutoff = datetime.datetime.combine(date, datetime.time.min)
+        if timezone.is_naive(cutoff):
+            cutoff = timezone.make_aware(cutoff)
+        return cutoff
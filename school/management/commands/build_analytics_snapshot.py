@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from school.cache import analytics_generation
+from school.snapshot import ANALYTICS_SNAPSHOT_PATH, build_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the per-course and per-teacher analytics metrics to the "
+        "memory-mapped snapshot file read by every worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            help="Snapshot file. Defaults to settings.ANALYTICS_SNAPSHOT_PATH.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep running and rebuild whenever the data changed, "
+            "checking every INTERVAL seconds.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"] or ANALYTICS_SNAPSHOT_PATH
+        if not path:
+            raise CommandError(
+                "No snapshot path: pass --path or set DJANGO_ANALYTICS_SNAPSHOT."
+            )
+
+        header = self._build(path)
+        while options["interval"]:
+            time.sleep(options["interval"])
+            if analytics_generation() != header["generation"]:
+                header = self._build(path)
+
+    def _build(self, path):
+        header = build_snapshot(path)
+        arrays = header["arrays"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {path}: {arrays['courses']['length']} courses, "
+                f"{arrays['teachers']['length']} teachers"
+            )
+        )
+        return header
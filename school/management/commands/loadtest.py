@@ -0,0 +1,272 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer,
+    WSGIRequestHandler,
+    get_internal_wsgi_application,
+)
+from django.db import OperationalError, connection
+
+from school.models import Course, Student
+
+DEFAULT_ROUTES = [
+    "/api/top-courses/",
+    "/api/teacher-courses/",
+    "/api/teacher-students/",
+    "/api/course-stats/",
+    "/api/course-latest/",
+    "/api/teacher-rating/",
+    "/api/top-teacher-courses/",
+    "/api/latest_rating/",
+    "/api/courses/syllabus/",
+]
+INGEST_ROUTE = "/api/ratings/"
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LockProbe:
+    """
+    Execute wrapper timing every write statement. In SQLite a write waits on
+    the database lock inside execute(), so under contention these timings are
+    dominated by lock waits; failures after the busy timeout are counted too.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.write_ms = []
+        self.locked_errors = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if "locked" in str(exc):
+                with self.lock:
+                    self.locked_errors += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.write_ms.append(elapsed)
+
+    def wrap(self, application):
+        def probed_application(environ, start_response):
+            with connection.execute_wrapper(self):
+                return application(environ, start_response)
+
+        return probed_application
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app in-process on a local port and drive a weighted mix of "
+        "/api/ routes with an asyncio HTTP client. Reports throughput, latency "
+        "percentiles, error rates and SQLite write-lock waits. Rating ingest "
+        "requests write real rows to the configured database. The client and "
+        "the server share one interpreter, so absolute numbers are a lower "
+        "bound on what a preforked deployment can do."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--route",
+            action="append",
+            dest="routes",
+            metavar="PATH[=WEIGHT]",
+            help="GET route to include in the mix, repeatable. Defaults to every analytics route.",
+        )
+        parser.add_argument(
+            "--ingest-weight",
+            type=float,
+            default=1.0,
+            help="Weight of POST /api/ratings/ requests in the mix (0 disables writes).",
+        )
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Target requests per second (open loop). By default every "
+            "client sends its next request as soon as the previous one finishes.",
+        )
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Seconds.")
+        parser.add_argument("--port", type=int, default=0, help="0 picks a free port.")
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        self.random = random.Random(options["seed"])
+        self.timeout = options["timeout"]
+        mix = self._build_mix(options["routes"] or DEFAULT_ROUTES, options["ingest_weight"])
+        self.course_ids = list(Course.objects.values_list("id", flat=True))
+        self.student_ids = list(Student.objects.values_list("id", flat=True))
+        if options["ingest_weight"] and not (self.course_ids and self.student_ids):
+            raise CommandError("Rating ingest needs courses and students; run seed_demo_data first.")
+        # The request threads open their own connections.
+        connection.close()
+
+        probe = LockProbe()
+        server = ThreadedWSGIServer(("127.0.0.1", options["port"]), QuietRequestHandler)
+        server.set_app(probe.wrap(get_internal_wsgi_application()))
+        self.port = server.server_address[1]
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.stdout.write(
+            f"Serving on 127.0.0.1:{self.port}, running for {options['duration']}s "
+            f"at concurrency {options['concurrency']}"
+            + (f", {options['rate']} req/s" if options["rate"] else "")
+        )
+
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        try:
+            elapsed = asyncio.run(
+                self._run(mix, options["concurrency"], options["rate"], options["duration"])
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+        self._report(elapsed, probe)
+
+    def _build_mix(self, routes, ingest_weight):
+        mix = []
+        for route in routes:
+            path, _, weight = route.partition("=")
+            try:
+                weight = float(weight) if weight else 1.0
+            except ValueError:
+                raise CommandError(f"Invalid weight in --route {route!r}.")
+            if not path.startswith("/"):
+                raise CommandError(f"Route {path!r} must start with '/'.")
+            mix.append((f"GET {path}", weight))
+        if ingest_weight > 0:
+            mix.append((f"POST {INGEST_ROUTE}", ingest_weight))
+        if not mix:
+            raise CommandError("The request mix is empty.")
+        return mix
+
+    async def _run(self, mix, concurrency, rate, duration):
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        started = time.perf_counter()
+        deadline = started + duration
+
+        if rate:
+            semaphore = asyncio.Semaphore(concurrency)
+            tasks = []
+            interval = 1 / rate
+            scheduled = started
+            while scheduled < deadline:
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                name = self.random.choices(names, weights)[0]
+                tasks.append(asyncio.create_task(self._limited(semaphore, name, scheduled)))
+                scheduled += interval
+            await asyncio.gather(*tasks)
+        else:
+            async def client():
+                while time.perf_counter() < deadline:
+                    await self._request(self.random.choices(names, weights)[0])
+
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    async def _limited(self, semaphore, name, scheduled):
+        # Latency is measured from the scheduled send time, so time spent
+        # queued behind a saturated server is not hidden.
+        async with semaphore:
+            await self._request(name, scheduled)
+
+    async def _request(self, name, started=None):
+        started = started or time.perf_counter()
+        method, path = name.split(" ", 1)
+        body = self._rating_body() if method == "POST" else None
+        try:
+            status = await asyncio.wait_for(self._fetch(method, path, body), self.timeout)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status = None
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        if status is None or status >= 400:
+            self.errors[name] += 1
+
+    def _rating_body(self):
+        return json.dumps(
+            {
+                "course": self.random.choice(self.course_ids),
+                "student": self.random.choice(self.student_ids),
+                "rating": self.random.randint(1, 5),
+                "comment": "Load test rating",
+            }
+        ).encode()
+
+    async def _fetch(self, method, path, body):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        try:
+            head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+            if body is not None:
+                head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            writer.write(head.encode() + b"\r\n" + (body or b""))
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    def _report(self, elapsed, probe):
+        header = f"{'Route':<36}{'Requests':>10}{'Errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        all_latencies = []
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            all_latencies.extend(values)
+            self.stdout.write(
+                f"{name:<36}{len(values):>10}{self.errors[name]:>8}"
+                f"{percentile(values, 50):>10.1f}{percentile(values, 90):>10.1f}"
+                f"{percentile(values, 99):>10.1f}{values[-1]:>10.1f}"
+            )
+        all_latencies.sort()
+        total = len(all_latencies)
+        errors = sum(self.errors.values())
+        self.stdout.write("")
+        self.stdout.write(
+            f"Total: {total} requests in {elapsed:.1f}s "
+            f"({total / elapsed:.1f} req/s), "
+            f"error rate {errors / total * 100 if total else 0:.2f}%"
+        )
+        self.stdout.write(
+            f"Latency: p50 {percentile(all_latencies, 50):.1f} ms, "
+            f"p90 {percentile(all_latencies, 90):.1f} ms, "
+            f"p99 {percentile(all_latencies, 99):.1f} ms"
+        )
+        writes = sorted(probe.write_ms)
+        self.stdout.write(
+            f"SQLite writes: {len(writes)} statements, "
+            f"p50 {percentile(writes, 50):.1f} ms, p95 {percentile(writes, 95):.1f} ms, "
+            f"max {writes[-1] if writes else 0:.1f} ms, "
+            f"total {sum(writes) / 1000:.2f}s; "
+            f"{probe.locked_errors} 'database is locked' errors"
+        )
@@ -0,0 +1,79 @@
+import io
+import pstats
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from school.middleware import make_profile_token, profiler_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the profiles written by SamplingProfilerMiddleware and print the "
+        "top cumulative hot spots for each endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            help="Profile directory. Defaults to SCHOOL_PROFILER['DIRECTORY'].",
+        )
+        parser.add_argument(
+            "--route",
+            action="append",
+            dest="routes",
+            help="Only report this route directory, e.g. api_course-stats. Repeatable.",
+        )
+        parser.add_argument("--limit", type=int, default=20, help="Functions per endpoint.")
+        parser.add_argument(
+            "--sort",
+            default="cumulative",
+            choices=["cumulative", "tottime", "calls"],
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the profiles after reporting them.",
+        )
+        parser.add_argument(
+            "--token",
+            action="store_true",
+            help="Print a signed X-Profile-Token header value and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["token"]:
+            self.stdout.write(make_profile_token())
+            return
+
+        directory = Path(options["directory"] or profiler_settings()["DIRECTORY"])
+        if not directory.is_dir():
+            raise CommandError(f"No profiles found in {directory}.")
+
+        route_directories = sorted(path for path in directory.iterdir() if path.is_dir())
+        if options["routes"]:
+            route_directories = [
+                path for path in route_directories if path.name in options["routes"]
+            ]
+
+        reported = 0
+        for route_directory in route_directories:
+            profiles = sorted(route_directory.glob("*.prof"))
+            if not profiles:
+                continue
+            reported += 1
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{route_directory.name} ({len(profiles)} profiled requests)"
+                )
+            )
+            output = io.StringIO()
+            stats = pstats.Stats(*map(str, profiles), stream=output)
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
+            self.stdout.write(output.getvalue())
+            if options["clear"]:
+                for profile in profiles:
+                    profile.unlink()
+
+        if not reported:
+            self.stdout.write(self.style.WARNING("No profiles to report."))
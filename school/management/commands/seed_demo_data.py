@@ -5,8 +5,12 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils.text import slugify
 
+from school.cache import invalidate_analytics, invalidate_syllabi
+from school.services import enroll
 from school.models import (
+    ArchivedRating,
     Course,
+    CourseRatingRollup,
     CourseMaterial,
     Lesson,
     Rating,
@@ -100,6 +104,7 @@ class Command(BaseCommand):
         self._attach_students_to_courses()
         self._create_lessons_and_materials()
         self._create_ratings()
+        self._invalidate_caches()
 
         self.stdout.write(self.style.SUCCESS("Demo data successfully generated!"))
         self._print_summary()
@@ -108,6 +113,8 @@ class Command(BaseCommand):
         CourseMaterial.objects.all().delete()
         Lesson.objects.all().delete()
         Rating.objects.all().delete()
+        ArchivedRating.objects.all().delete()
+        CourseRatingRollup.objects.all().delete()
         Course.objects.all().delete()
         Student.objects.all().delete()
         Teacher.objects.all().delete()
@@ -148,10 +155,12 @@ class Command(BaseCommand):
         self.stdout.write(f"Created {len(self.courses)} courses")
 
     def _attach_students_to_courses(self):
+        pairs = []
         for course in self.courses:
             cohort_size = random.randint(8, min(18, len(self.students)))
             enrolled = random.sample(self.students, cohort_size)
-            course.students.set(enrolled)
+            pairs.extend((course.pk, student.pk) for student in enrolled)
+        enroll(pairs)
         self.stdout.write("Assigned students to courses")
 
     def _create_lessons_and_materials(self):
@@ -201,9 +210,15 @@ class Command(BaseCommand):
                         comment=random.choice(COMMENTS),
                     )
                 )
-        Rating.objects.bulk_create(ratings)
+        ratings = Rating.objects.bulk_upsert(ratings)
         self.stdout.write(f"Created {len(ratings)} ratings")
 
+    def _invalidate_caches(self):
+        # bulk_create() does not send post_save, so the cache signals never fire.
+        course_ids = [course.pk for course in self.courses]
+        transaction.on_commit(invalidate_analytics)
+        transaction.on_commit(lambda: invalidate_syllabi(*course_ids))
+
     def _print_summary(self):
         self.stdout.write("\nSummary:")
         self.stdout.write(f"  Teachers: {Teacher.objects.count()}")
@@ -0,0 +1,91 @@
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_HEADER = "HTTP_X_PROFILE_TOKEN"
+PROFILE_SALT = "school.profiler"
+
+PROFILER_DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,
+    "DIRECTORY": Path(settings.BASE_DIR) / "profiles",
+    "PATH_PREFIX": "/api/",
+    "TOKEN_MAX_AGE": 60 * 60,
+}
+
+
+def profiler_settings():
+    return {**PROFILER_DEFAULTS, **getattr(settings, "SCHOOL_PROFILER", {})}
+
+
+def make_profile_token():
+    """Signed value for the X-Profile-Token header that forces a profile."""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign("profile")
+
+
+def route_directory_name(route):
+    return re.sub(r"[^A-Za-z0-9-]+", "_", route).strip("_") or "root"
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profile a random sample of requests, or any request carrying a valid
+    X-Profile-Token header, with cProfile and write one .prof file per request
+    into a directory per URL route. ``manage.py profile_report`` merges them.
+    """
+
+    def __init__(self, get_response):
+        config = profiler_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config["SAMPLE_RATE"]
+        self.directory = Path(config["DIRECTORY"])
+        self.path_prefix = config["PATH_PREFIX"]
+        self.token_max_age = config["TOKEN_MAX_AGE"]
+        self.signer = signing.TimestampSigner(salt=PROFILE_SALT)
+        # cProfile allows one active profiler per process.
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        if not request.path.startswith(self.path_prefix) or not self._wants_profile(request):
+            return self.get_response(request)
+        if not self.lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+        finally:
+            self.lock.release()
+        self._dump(profiler, request)
+        return response
+
+    def _wants_profile(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token:
+            try:
+                self.signer.unsign(token, max_age=self.token_max_age)
+                return True
+            except signing.BadSignature:
+                pass
+        return random.random() < self.sample_rate
+
+    def _dump(self, profiler, request):
+        match = request.resolver_match
+        directory = self.directory / route_directory_name(
+            match.route if match else "unresolved"
+        )
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}.prof"
+        # Write then rename so profile_report never reads a partial file.
+        partial = path.with_suffix(".partial")
+        profiler.dump_stats(partial)
+        os.replace(partial, path)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:33
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """Keep only the most recent rating (highest id) per (course, student)."""
+    Rating = apps.get_model('school', 'Rating')
+    latest_ids = (
+        Rating.objects.values('course', 'student')
+        .annotate(latest_id=Max('id'))
+        .values('latest_id')
+    )
+    Rating.objects.exclude(id__in=latest_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('course', 'student'), name='unique_rating_per_student'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:39
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('school', '0002_unique_rating_per_student'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseRatingRollup',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_rollup', serialize=False, to='school.course')),
+                ('reviews_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('latest_rating_id', models.BigIntegerField(null=True)),
+                ('latest_rating', models.PositiveIntegerField(null=True)),
+                ('latest_student_id', models.BigIntegerField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+        # Existing ratings get the time this migration runs: their real
+        # creation time was never recorded (see archive_ratings --before-id).
+        migrations.AddField(
+            model_name='rating',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='ArchivedRating',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('rating', models.PositiveIntegerField()),
+                ('comment', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='school.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='school.student')),
+            ],
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
-from django.db.models import Avg, Count
+from collections import defaultdict
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, FloatField, Max, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
 
 class Teacher(models.Model):
     name = models.CharField(max_length=100)
@@ -11,10 +15,67 @@ class Student(models.Model):
 
 class CourseQuerySet(models.QuerySet):
     def with_rating_stats(self):
+        """
+        Annotate ``reviews_count``, ``rating_sum`` and ``avg_rating`` over the
+        live ratings plus the archived ones folded into ``rating_rollup``.
+        Live ratings are aggregated in subqueries, so other joins on the
+        queryset (e.g. students) do not multiply them.
+        """
+        live = Rating.objects.filter(course=OuterRef("pk")).order_by().values("course")
+        live_count = Subquery(live.annotate(total=Count("pk")).values("total"))
+        live_sum = Subquery(live.annotate(total=Sum("rating")).values("total"))
+        return self.annotate(
+            reviews_count=Coalesce(live_count, 0)
+            + Coalesce(F("rating_rollup__reviews_count"), 0),
+            rating_sum=Coalesce(live_sum, 0)
+            + Coalesce(F("rating_rollup__rating_sum"), 0),
+        ).annotate(
+            avg_rating=Cast("rating_sum", FloatField()) / NullIf("reviews_count", 0),
+        )
+
+    def with_latest_rating(self):
+        """
+        Annotate ``latest_rating`` and ``latest_student_id`` of the most recent
+        rating (highest id), whether it is still live or already archived.
+        """
+        latest = Rating.objects.filter(course=OuterRef("pk")).order_by("-id")
+        live_is_latest = Q(rating_rollup__latest_rating_id__isnull=True) | Q(
+            live_latest_id__gt=F("rating_rollup__latest_rating_id")
+        )
         return self.annotate(
-            reviews_count=Count("rating"),
-            avg_rating=Avg("rating__rating"),
+            live_latest_id=Subquery(latest.values("id")[:1])
+        ).annotate(
+            latest_rating=Case(
+                When(live_is_latest, then=Subquery(latest.values("rating")[:1])),
+                default=F("rating_rollup__latest_rating"),
+            ),
+            latest_student_id=Case(
+                When(live_is_latest, then=Subquery(latest.values("student_id")[:1])),
+                default=F("rating_rollup__latest_student_id"),
+                output_field=models.BigIntegerField(),
+            ),
+        )
+
+    def teacher_rating_stats(self):
+        """
+        Fold the rating stats of these courses per teacher. Returns
+        ``{teacher_id: (total_course, reviews_count, avg_rating)}`` where
+        ``total_course`` counts one row per rating of a course (one for a
+        course without ratings), as the course/rating join always has.
+        """
+        totals = defaultdict(lambda: [0, 0, 0])
+        rows = self.with_rating_stats().values_list(
+            "teacher_id", "reviews_count", "rating_sum"
         )
+        for teacher_id, reviews_count, rating_sum in rows:
+            total = totals[teacher_id]
+            total[0] += max(reviews_count, 1)
+            total[1] += reviews_count
+            total[2] += rating_sum
+        return {
+            teacher_id: (total_course, reviews_count, rating_sum / reviews_count if reviews_count else None)
+            for teacher_id, (total_course, reviews_count, rating_sum) in totals.items()
+        }
 
 class Course(models.Model):
     objects = CourseQuerySet.as_manager()
@@ -22,6 +83,7 @@ class Course(models.Model):
     teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE) 
     students = models.ManyToManyField(Student, related_name='courses')
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    is_archived = models.BooleanField(default=False)
 
 class Lesson(models.Model):
     title = models.CharField(max_length=100)
@@ -33,8 +95,192 @@ class CourseMaterial(models.Model):
     material_type = models.CharField(max_length=20)
     link = models.URLField()
 
+class RatingQuerySet(models.QuerySet):
+    def bulk_upsert(self, ratings, batch_size=500):
+        """
+        Insert ratings, updating ``rating`` and ``comment`` in place when the
+        student already rated the course. When a pair appears more than once
+        in ``ratings``, the last one wins. An archived rating for the same
+        pair is superseded and taken out of the rollups.
+        """
+        from .cache import invalidate_analytics_on_commit
+
+        ratings = list({(r.course_id, r.student_id): r for r in ratings}.values())
+        with transaction.atomic():
+            # Write first: SQLite waits for the busy timeout when a
+            # transaction starts with a write, but fails at once with
+            # "database is locked" when a read transaction has to upgrade.
+            ratings = self.bulk_create(
+                ratings,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["course", "student"],
+                update_fields=["rating", "comment"],
+            )
+            ArchivedRating.objects.supersede(
+                (r.course_id, r.student_id) for r in ratings
+            )
+        # bulk_create() does not send post_save, so the cache signals never fire.
+        invalidate_analytics_on_commit(self.db)
+        return ratings
+
 class Rating(models.Model):
+    objects = RatingQuerySet.as_manager()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    rating = models.PositiveIntegerField()
+    comment = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["course", "student"], name="unique_rating_per_student"
+            ),
+        ]
+
+class CourseRatingRollup(models.Model):
+    """
+    Contribution of a course's archived ratings to its rating stats. Read
+    together with the live ratings by CourseQuerySet.with_rating_stats()
+    and with_latest_rating().
+    """
+
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name="rating_rollup"
+    )
+    reviews_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    latest_rating_id = models.BigIntegerField(null=True)
+    latest_rating = models.PositiveIntegerField(null=True)
+    latest_student_id = models.BigIntegerField(null=True)
+
+class ArchivedRatingQuerySet(models.QuerySet):
+    def archive(self, ratings):
+        """
+        Fold ``ratings`` (Rating instances) into the course rollups, copy them
+        here with their original ids and delete them from Rating. Call inside
+        a transaction.
+        """
+        ratings = list(ratings)
+        by_course = defaultdict(list)
+        for rating in ratings:
+            by_course[rating.course_id].append(rating)
+        rollups = CourseRatingRollup.objects.in_bulk(list(by_course))
+
+        for course_id, course_ratings in by_course.items():
+            rollup = rollups.get(course_id) or CourseRatingRollup(course_id=course_id)
+            rollup.reviews_count += len(course_ratings)
+            rollup.rating_sum += sum(rating.rating for rating in course_ratings)
+            latest = max(course_ratings, key=lambda rating: rating.id)
+            if rollup.latest_rating_id is None or latest.id > rollup.latest_rating_id:
+                rollup.latest_rating_id = latest.id
+                rollup.latest_rating = latest.rating
+                rollup.latest_student_id = latest.student_id
+            rollups[course_id] = rollup
+        self._save_rollups(rollups.values())
+
+        archived_at = timezone.now()
+        self.bulk_create(
+            [
+                ArchivedRating(
+                    id=rating.id,
+                    course_id=rating.course_id,
+                    student_id=rating.student_id,
+                    rating=rating.rating,
+                    comment=rating.comment,
+                    created_at=rating.created_at,
+                    archived_at=archived_at,
+                )
+                for rating in ratings
+            ]
+        )
+        # Each post_delete asks for an analytics invalidation; the signal
+        # queues one for the whole transaction.
+        Rating.objects.filter(pk__in=[rating.id for rating in ratings]).delete()
+
+    def supersede(self, pairs):
+        """
+        Remove the archived ratings of these (course_id, student_id) pairs
+        and their contribution to the rollups, because a new live rating
+        replaces them.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return
+        candidates = self.filter(
+            course_id__in={course_id for course_id, _ in pairs},
+            student_id__in={student_id for _, student_id in pairs},
+        ).values_list("id", "course_id", "student_id")
+        self.filter(
+            pk__in=[
+                pk
+                for pk, course_id, student_id in candidates
+                if (course_id, student_id) in pairs
+            ]
+        ).remove()
+
+    def remove(self):
+        """
+        Delete these archived ratings and take them out of the course
+        rollups. Use it instead of delete(), which leaves the rollups
+        counting them.
+        """
+        removed = list(self)
+        if not removed:
+            return
+
+        course_ids = {archived.course_id for archived in removed}
+        rollups = CourseRatingRollup.objects.in_bulk(list(course_ids))
+        for archived in removed:
+            rollup = rollups[archived.course_id]
+            rollup.reviews_count -= 1
+            rollup.rating_sum -= archived.rating
+        ArchivedRating.objects.filter(pk__in=[archived.id for archived in removed]).delete()
+
+        latest_ids = (
+            ArchivedRating.objects.filter(course_id__in=course_ids)
+            .values("course_id")
+            .annotate(latest_id=Max("id"))
+            .values_list("latest_id", flat=True)
+        )
+        latest_by_course = {
+            archived.course_id: archived
+            for archived in ArchivedRating.objects.filter(pk__in=latest_ids)
+        }
+        for course_id, rollup in rollups.items():
+            latest = latest_by_course.get(course_id)
+            rollup.latest_rating_id = latest and latest.id
+            rollup.latest_rating = latest and latest.rating
+            rollup.latest_student_id = latest and latest.student_id
+        self._save_rollups(rollups.values())
+
+    def _save_rollups(self, rollups):
+        CourseRatingRollup.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=["course"],
+            update_fields=[
+                "reviews_count",
+                "rating_sum",
+                "latest_rating_id",
+                "latest_rating",
+                "latest_student_id",
+            ],
+        )
+
+class ArchivedRating(models.Model):
+    """
+    A rating moved out of the hot Rating table, keeping its original id.
+    Delete archived ratings with ``ArchivedRating.objects.remove()`` so the
+    rollups stay in sync; deleting a student does that through a signal.
+    """
+
+    objects = ArchivedRatingQuerySet.as_manager()
+    id = models.BigIntegerField(primary_key=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     rating = models.PositiveIntegerField()
     comment = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
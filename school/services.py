@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import invalidate_analytics_on_commit
+from .models import Course
+
+ENROLLMENT_BATCH_SIZE = getattr(settings, "ENROLLMENT_BATCH_SIZE", 1000)
+
+Enrollment = Course.students.through
+
+
+def _enrolled(pairs, batch_size):
+    """The ``(course_id, student_id)`` pairs among ``pairs`` already enrolled."""
+    course_ids = {course_id for course_id, _ in pairs}
+    student_ids = sorted({student_id for _, student_id in pairs})
+    enrolled = set()
+    for start in range(0, len(student_ids), batch_size):
+        enrolled.update(
+            Enrollment.objects.filter(
+                course_id__in=course_ids,
+                student_id__in=student_ids[start : start + batch_size],
+            ).values_list("course_id", "student_id")
+        )
+    return enrolled & set(pairs)
+
+
+def update_enrollments(enroll=(), unenroll=(), batch_size=ENROLLMENT_BATCH_SIZE):
+    """
+    Enroll and unenroll ``(course_id, student_id)`` pairs in one transaction,
+    writing straight to the Course.students through table. Enrollments are
+    inserted in batches, skipping pairs already enrolled; removals run one
+    ``DELETE ... WHERE course_id = ? AND student_id IN (...)`` per course and
+    chunk of at most ``batch_size`` students. Returns ``(enrolled, removed)``,
+    the number of rows inserted and deleted.
+    """
+    pairs = list(dict.fromkeys(enroll))
+    # Checked before the transaction starts: on SQLite a transaction that
+    # reads before it writes cannot wait for the write lock. A pair enrolled
+    # by a concurrent request in between is skipped by ignore_conflicts.
+    enrolled = _enrolled(pairs, batch_size) if pairs else set()
+    new_pairs = [pair for pair in pairs if pair not in enrolled]
+
+    students_by_course = defaultdict(list)
+    for course_id, student_id in set(unenroll):
+        students_by_course[course_id].append(student_id)
+
+    removed = 0
+    with transaction.atomic():
+        Enrollment.objects.bulk_create(
+            [Enrollment(course_id=course_id, student_id=student_id) for course_id, student_id in new_pairs],
+            ignore_conflicts=True,
+            batch_size=batch_size,
+        )
+        for course_id, student_ids in students_by_course.items():
+            for start in range(0, len(student_ids), batch_size):
+                removed += Enrollment.objects.filter(
+                    course_id=course_id,
+                    student_id__in=student_ids[start : start + batch_size],
+                ).delete()[0]
+        if new_pairs or removed:
+            # The through table writes send no m2m_changed, so invalidate
+            # the cached student counts once for the whole request.
+            invalidate_analytics_on_commit()
+    return len(new_pairs), removed
+
+
+def enroll(pairs, batch_size=ENROLLMENT_BATCH_SIZE):
+    """Enroll ``(course_id, student_id)`` pairs; returns the number inserted."""
+    return update_enrollments(enroll=pairs, batch_size=batch_size)[0]
+
+
+def unenroll(pairs, batch_size=ENROLLMENT_BATCH_SIZE):
+    """Remove ``(course_id, student_id)`` enrollments; returns the number removed."""
+    return update_enrollments(unenroll=pairs, batch_size=batch_size)[1]
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_analytics, invalidate_analytics_on_commit, invalidate_syllabi
+from .dimensions import student_names, teacher_names
+from .models import ArchivedRating, Course, CourseMaterial, Lesson, Rating, Student, Teacher
+
+
+def _invalidate_syllabi_on_commit(*course_ids):
+    transaction.on_commit(lambda: invalidate_syllabi(*course_ids))
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    _invalidate_syllabi_on_commit(instance.pk)
+
+
+# The pre_save receivers remember the course a lesson or material belonged
+# to before the save, so moving it also invalidates the old course.
+
+
+@receiver(pre_save, sender=Lesson)
+def lesson_saving(sender, instance, **kwargs):
+    if instance._state.adding:
+        return
+    instance._previous_course_id = (
+        Lesson.objects.filter(pk=instance.pk)
+        .values_list("course_id", flat=True)
+        .first()
+    )
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def lesson_changed(sender, instance, **kwargs):
+    previous_course_id = vars(instance).pop("_previous_course_id", None)
+    _invalidate_syllabi_on_commit(instance.course_id, previous_course_id)
+
+
+@receiver(pre_save, sender=CourseMaterial)
+def material_saving(sender, instance, **kwargs):
+    if instance._state.adding:
+        return
+    instance._previous_lesson = (
+        CourseMaterial.objects.filter(pk=instance.pk)
+        .values_list("lesson_id", "lesson__course_id")
+        .first()
+    )
+
+
+@receiver([post_save, post_delete], sender=CourseMaterial)
+def material_changed(sender, instance, **kwargs):
+    previous_lesson_id, previous_course_id = (
+        vars(instance).pop("_previous_lesson", None) or (None, None)
+    )
+    if previous_lesson_id == instance.lesson_id:
+        course_id = previous_course_id
+    elif CourseMaterial.lesson.is_cached(instance):
+        course_id = instance.lesson.course_id
+    else:
+        course_id = (
+            Lesson.objects.filter(pk=instance.lesson_id)
+            .values_list("course_id", flat=True)
+            .first()
+        )
+    _invalidate_syllabi_on_commit(course_id, previous_course_id)
+
+
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Rating)
+def analytics_changed(sender, using, **kwargs):
+    invalidate_analytics_on_commit(using)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def enrollment_changed(sender, action, using, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_analytics_on_commit(using)
+
+
+def _invalidate_names_on_commit(names):
+    def invalidate():
+        # Names first: a request between the two bumps would otherwise
+        # cache a response with old names under the new analytics generation.
+        names.invalidate()
+        invalidate_analytics()
+
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Teacher)
+def teacher_changed(sender, **kwargs):
+    _invalidate_names_on_commit(teacher_names)
+
+
+@receiver([post_save, post_delete], sender=Student)
+def student_changed(sender, **kwargs):
+    _invalidate_names_on_commit(student_names)
+
+
+@receiver(pre_delete, sender=Student)
+def student_deleting(sender, instance, **kwargs):
+    # The student's archived ratings are deleted by the cascade; take them
+    # out of the course rollups first.
+    ArchivedRating.objects.filter(student=instance).remove()
@@ -0,0 +1,351 @@
+import json
+import logging
+import math
+import mmap
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+
+from .cache import analytics_generation
+from .locks import WorkerLock
+from .models import Course, Teacher
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_SNAPSHOT_PATH = getattr(settings, "ANALYTICS_SNAPSHOT_PATH", None)
+# Minimum time between two automatic rebuilds across all workers.
+ANALYTICS_SNAPSHOT_REBUILD_INTERVAL = getattr(
+    settings, "ANALYTICS_SNAPSHOT_REBUILD_INTERVAL", 10
+)
+# How long a snapshot built before the latest write may still be served
+# while its replacement is built.
+ANALYTICS_SNAPSHOT_MAX_STALENESS = getattr(
+    settings, "ANALYTICS_SNAPSHOT_MAX_STALENESS", ANALYTICS_SNAPSHOT_REBUILD_INTERVAL
+)
+# How often a worker checks whether the snapshot file was swapped.
+SNAPSHOT_CHECK_INTERVAL = 1
+SNAPSHOT_REBUILD_LOCK_KEY = "school:snapshot:rebuild"
+# Expiry of the rebuild lock when it falls back to the cache.
+SNAPSHOT_REBUILD_LOCK_TIMEOUT = 5 * 60
+
+MAGIC = b"SCHOOLSNAP1\n"
+# The magic, header length and JSON header live in the first HEADER_SIZE
+# bytes; each array starts at an ALIGNMENT boundary after it.
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+
+COURSE_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("teacher_id", "<i8"),
+        ("title", f"<U{Course._meta.get_field('title').max_length}"),
+        ("price_cents", "<i8"),
+        ("reviews_count", "<i8"),
+        ("avg_rating", "<f8"),
+        ("student_count", "<i8"),
+        ("latest_rating", "<f8"),
+    ]
+)
+TEACHER_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("total_course", "<i8"),
+        ("reviews_count", "<i8"),
+        ("avg_rating", "<f8"),
+        ("student_count", "<i8"),
+        ("latest_rating", "<f8"),
+    ]
+)
+DTYPES = {"courses": COURSE_DTYPE, "teachers": TEACHER_DTYPE}
+
+
+def _nan_if_none(value):
+    return math.nan if value is None else value
+
+
+def _course_array():
+    """
+    The course array, and ``{teacher_id: (rating_id, rating)}`` of the latest
+    rating (highest id, live or archived) across each teacher's courses.
+    """
+    rows = (
+        Course.objects.with_rating_stats()
+        .with_latest_rating()
+        .order_by("id")
+        .values_list(
+            "id",
+            "teacher_id",
+            "title",
+            "price",
+            "reviews_count",
+            "avg_rating",
+            "latest_rating",
+            "live_latest_id",
+            "rating_rollup__latest_rating_id",
+        )
+    )
+    student_counts = dict(
+        Course.objects.annotate(student_count=Count("students", distinct=True))
+        .values_list("id", "student_count")
+    )
+    courses = []
+    latest_by_teacher = {}
+    for pk, teacher_id, title, price, reviews_count, avg_rating, latest, *latest_ids in rows:
+        courses.append(
+            (
+                pk,
+                teacher_id,
+                title,
+                int(price * 100),
+                reviews_count,
+                _nan_if_none(avg_rating),
+                student_counts.get(pk, 0),
+                _nan_if_none(latest),
+            )
+        )
+        latest_id = max((rating_id for rating_id in latest_ids if rating_id is not None), default=None)
+        if latest_id is not None and latest_id > latest_by_teacher.get(teacher_id, (0,))[0]:
+            latest_by_teacher[teacher_id] = (latest_id, latest)
+    return np.array(courses, dtype=COURSE_DTYPE), latest_by_teacher
+
+
+def _teacher_array(latest_by_teacher):
+    # Same stats as average_rating_per_teacher, so results are identical.
+    rating_stats = Course.objects.teacher_rating_stats()
+    teacher_ids = Teacher.objects.order_by("id").values_list("id", flat=True)
+    student_counts = dict(
+        Teacher.objects.annotate(
+            student_count=Count("course__students", distinct=True)
+        ).values_list("id", "student_count")
+    )
+    return np.array(
+        [
+            (
+                pk,
+                total_course,
+                reviews_count,
+                _nan_if_none(avg),
+                student_counts.get(pk, 0),
+                _nan_if_none(latest_by_teacher.get(pk, (None, None))[1]),
+            )
+            for pk, (total_course, reviews_count, avg) in (
+                (pk, rating_stats.get(pk, (0, 0, None))) for pk in teacher_ids
+            )
+        ],
+        dtype=TEACHER_DTYPE,
+    )
+
+
+def build_snapshot(path=None):
+    """
+    Compute the per-course and per-teacher metrics and atomically replace the
+    snapshot file. The analytics generation and ``built_at`` are read before
+    querying, so a write that lands during the build marks the new snapshot
+    stale and its age covers the whole build.
+    """
+    path = Path(path or ANALYTICS_SNAPSHOT_PATH)
+    generation = analytics_generation()
+    built_at = time.time()
+    with transaction.atomic():
+        courses, latest_by_teacher = _course_array()
+        arrays = {"courses": courses, "teachers": _teacher_array(latest_by_teacher)}
+
+    header = {"generation": generation, "built_at": built_at, "arrays": {}}
+    offset = HEADER_SIZE
+    for name, array in arrays.items():
+        header["arrays"][name] = {"offset": offset, "length": len(array)}
+        offset += math.ceil(array.nbytes / ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header).encode()
+    if len(MAGIC) + 4 + len(header_bytes) > HEADER_SIZE:
+        raise ValueError("Snapshot header does not fit in HEADER_SIZE.")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temporary file per build, so concurrent builds never write
+    # into the same file before it is swapped in.
+    fd, partial = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".partial"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, "little"))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.seek(header["arrays"][name]["offset"])
+                f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(partial, 0o644)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    return header
+
+
+def _parse_header(data, path):
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an analytics snapshot.")
+    start = len(MAGIC) + 4
+    header_length = int.from_bytes(data[len(MAGIC) : start], "little")
+    return json.loads(data[start : start + header_length])
+
+
+def read_header(path):
+    """The header of the snapshot file at ``path``, or None if there is none."""
+    try:
+        with open(path, "rb") as f:
+            return _parse_header(f.read(HEADER_SIZE), path)
+    except FileNotFoundError:
+        return None
+
+
+def _file_id(stat):
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class AnalyticsSnapshot:
+    """
+    Read-only view of a snapshot file; the arrays are memory-mapped. The
+    header and the arrays come from one mapping of one open file, so a
+    rebuild swapping the file in meanwhile cannot mix the two.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.file_id = _file_id(os.fstat(f.fileno()))
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _parse_header(buffer, path)
+        self.generation = header["generation"]
+        self.built_at = header["built_at"]
+        for name, info in header["arrays"].items():
+            if info["length"]:
+                array = np.frombuffer(
+                    buffer,
+                    dtype=DTYPES[name],
+                    count=info["length"],
+                    offset=info["offset"],
+                )
+            else:
+                array = np.empty(0, dtype=DTYPES[name])
+            setattr(self, name, array)
+
+    def top_courses(self, filters):
+        """Courses matching the TopCoursesFilterForm values, best rated first."""
+        courses = self.courses
+        mask = (courses["reviews_count"] >= filters["min_reviews"]) & (
+            courses["avg_rating"] > float(filters["min_avg"])
+        )
+        if filters["teacher_id"] is not None:
+            mask &= courses["teacher_id"] == filters["teacher_id"]
+        if filters["price_min"] is not None:
+            mask &= courses["price_cents"] >= math.ceil(filters["price_min"] * 100)
+        if filters["price_max"] is not None:
+            mask &= courses["price_cents"] <= math.floor(filters["price_max"] * 100)
+        selected = courses[mask]
+        selected = selected[np.lexsort((selected["id"], -selected["avg_rating"]))]
+        return selected[: filters["limit"]]
+
+    def teachers_matching(self, filters):
+        teachers = self.teachers
+        if filters["teacher_id"] is not None:
+            teachers = teachers[teachers["id"] == filters["teacher_id"]]
+        return teachers[: filters["limit"]]
+
+
+class SnapshotReader:
+    """
+    Per-process handle on the snapshot file. It remaps the file when it has
+    been replaced. A snapshot built before the latest write triggers a
+    background rebuild, and is only handed out until it is
+    ANALYTICS_SNAPSHOT_MAX_STALENESS old. One rebuild runs at a time across
+    workers (a WorkerLock), and none starts while the file on disk is less
+    than ANALYTICS_SNAPSHOT_REBUILD_INTERVAL old.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._snapshot = None
+        self._file_id = None
+        self._checked_at = -math.inf
+        self._rebuild_requested_at = -math.inf
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        ``(snapshot, max_age)``: the snapshot or None, and for a stale one the
+        seconds it may still be served for (None when it is current).
+        """
+        if not self.path:
+            return None, None
+        snapshot = self._load()
+        if snapshot is None:
+            self._schedule_rebuild()
+            return None, None
+        if snapshot.generation == analytics_generation():
+            return snapshot, None
+        self._schedule_rebuild()
+        max_age = int(snapshot.built_at + ANALYTICS_SNAPSHOT_MAX_STALENESS - time.time())
+        if max_age <= 0:
+            return None, None
+        return snapshot, max_age
+
+    def _load(self):
+        now = time.monotonic()
+        if now - self._checked_at < SNAPSHOT_CHECK_INTERVAL:
+            return self._snapshot
+        with self._lock:
+            try:
+                if _file_id(os.stat(self.path)) != self._file_id:
+                    self._snapshot = AnalyticsSnapshot(self.path)
+                    # The id of the file actually mapped, which may already
+                    # be newer than the one stat() saw.
+                    self._file_id = self._snapshot.file_id
+            except FileNotFoundError:
+                self._snapshot = self._file_id = None
+            self._checked_at = now
+            return self._snapshot
+
+    def _schedule_rebuild(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._rebuild_requested_at < ANALYTICS_SNAPSHOT_REBUILD_INTERVAL:
+                return
+            self._rebuild_requested_at = now
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        lock = WorkerLock(SNAPSHOT_REBUILD_LOCK_KEY, timeout=SNAPSHOT_REBUILD_LOCK_TIMEOUT)
+        if not lock.acquire():
+            # Another worker is rebuilding it.
+            return
+        try:
+            header = read_header(self.path)
+            age = math.inf if header is None else time.time() - header["built_at"]
+            if age >= ANALYTICS_SNAPSHOT_REBUILD_INTERVAL:
+                build_snapshot(self.path)
+        except Exception:
+            logger.exception("Rebuilding the analytics snapshot failed")
+        finally:
+            lock.release()
+            connections.close_all()
+
+
+snapshot_reader = SnapshotReader(ANALYTICS_SNAPSHOT_PATH)
+
+
+def current_snapshot():
+    """
+    ``(snapshot, max_age)`` of the shared analytics snapshot. The snapshot is
+    None when disabled, missing or too stale; ``max_age`` is set when it
+    predates the latest write, and bounds how long a response built from it
+    may be cached.
+    """
+    return snapshot_reader.get()
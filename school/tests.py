@@ -1,3 +1,726 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Max, Sum
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from . import locks, signals, snapshot, views
+from .cache import cached_analytics, get_syllabi, invalidate_syllabi, set_syllabi
+from .locks import WorkerLock
+from .middleware import make_profile_token
+from .models import ArchivedRating, Course, CourseMaterial, Lesson, Rating, Student, Teacher
+from .services import enroll, unenroll
+from .singleflight import SingleFlight
+from .snapshot import AnalyticsSnapshot, SnapshotReader, build_snapshot, current_snapshot
+from .warmup import warm_up
+
+
+class SchoolTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        # The fixtures count as committed: run their on_commit hooks rather
+        # than leave them queued in the never-committed class transaction.
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.create_fixtures()
+
+    @classmethod
+    def create_fixtures(cls):
+        cls.teacher = Teacher.objects.create(name="Noor", bio="")
+        cls.other_teacher = Teacher.objects.create(name="Ali Raza", bio="")
+        cls.students = [
+            Student.objects.create(name=f"Student {i}", email=f"s{i}@example.com")
+            for i in range(4)
+        ]
+        cls.python = Course.objects.create(title="Python Basics", teacher=cls.teacher, price=10)
+        cls.django = Course.objects.create(title="Django Mastery", teacher=cls.teacher, price=25)
+        cls.react = Course.objects.create(title="React from Zero", teacher=cls.other_teacher, price=40)
+
+
+class SyllabusCacheTests(SchoolTestCase):
+    def syllabus(self, course):
+        return self.client.get(f"/api/courses/{course.pk}/syllabus/").json()
+
+    def test_moving_a_lesson_invalidates_both_courses(self):
+        lesson = Lesson.objects.create(title="Intro", course=self.python, duration_minutes=30)
+        self.assertEqual(len(self.syllabus(self.python)["lessons"]), 1)
+        self.assertEqual(len(self.syllabus(self.django)["lessons"]), 0)
+
+        lesson.course = self.django
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.save()
+
+        self.assertEqual(len(self.syllabus(self.python)["lessons"]), 0)
+        self.assertEqual(len(self.syllabus(self.django)["lessons"]), 1)
+
+    def test_moving_a_material_invalidates_both_courses(self):
+        first = Lesson.objects.create(title="Intro", course=self.python, duration_minutes=30)
+        second = Lesson.objects.create(title="Models", course=self.django, duration_minutes=45)
+        material = CourseMaterial.objects.create(
+            lesson=first, material_type="video", link="https://example.com/intro"
+        )
+        self.assertEqual(len(self.syllabus(self.python)["lessons"][0]["materials"]), 1)
+        self.assertEqual(len(self.syllabus(self.django)["lessons"][0]["materials"]), 0)
+
+        material.lesson = second
+        with self.captureOnCommitCallbacks(execute=True):
+            material.save()
+
+        self.assertEqual(len(self.syllabus(self.python)["lessons"][0]["materials"]), 0)
+        self.assertEqual(len(self.syllabus(self.django)["lessons"][0]["materials"]), 1)
+
+
+    def test_syllabus_built_before_an_invalidation_is_not_served(self):
+        syllabi, generations = get_syllabi([self.python.pk])
+        self.assertEqual(syllabi, {})
+        # A lesson edit commits while the syllabus is being built.
+        invalidate_syllabi(self.python.pk)
+        set_syllabi({self.python.pk: {"stale": True}}, generations)
+
+        self.assertEqual(get_syllabi([self.python.pk])[0], {})
+        self.assertNotIn("stale", self.syllabus(self.python))
+
+    def test_new_lessons_and_materials_do_not_query_in_signals(self):
+        with self.assertNumQueries(1):
+            lesson = Lesson.objects.create(title="Intro", course=self.python, duration_minutes=30)
+        with self.assertNumQueries(1):
+            CourseMaterial.objects.create(
+                lesson=lesson, material_type="video", link="https://example.com/intro"
+            )
+
+    def test_out_of_range_ids(self):
+        too_big = 2**63
+        self.assertEqual(self.client.get(f"/api/courses/{too_big}/syllabus/").status_code, 404)
+        response = self.client.get(f"/api/courses/syllabus/?ids=1,{too_big}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/api/courses/syllabus/?ids=0").status_code, 400)
+
+
+class RatingUpsertTests(SchoolTestCase):
+    def post_ratings(self, payload):
+        return self.client.post(
+            "/api/ratings/", json.dumps(payload), content_type="application/json"
+        )
+
+    def test_repost_updates_the_rating_in_place(self):
+        student = self.students[0]
+        first = self.post_ratings(
+            {"course": self.python.pk, "student": student.pk, "rating": 2, "comment": "Meh"}
+        ).json()["ids"]
+        second = self.post_ratings(
+            {"course": self.python.pk, "student": student.pk, "rating": 5, "comment": "Great"}
+        ).json()["ids"]
+
+        self.assertEqual(first, second)
+        rating = Rating.objects.get()
+        self.assertEqual((rating.rating, rating.comment), (5, "Great"))
+
+    def test_last_duplicate_in_a_batch_wins(self):
+        student = self.students[0]
+        ratings = Rating.objects.bulk_upsert(
+            [
+                Rating(course=self.python, student=student, rating=1, comment=""),
+                Rating(course=self.django, student=student, rating=3, comment=""),
+                Rating(course=self.python, student=student, rating=4, comment=""),
+            ]
+        )
+
+        self.assertEqual(len(ratings), 2)
+        self.assertEqual(
+            dict(Rating.objects.values_list("course_id", "rating")),
+            {self.python.pk: 4, self.django.pk: 3},
+        )
+
+    def test_unknown_ids_are_rejected(self):
+        response = self.post_ratings(
+            [{"course": self.python.pk, "student": 9999, "rating": 5}]
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["students"], [9999])
+        self.assertFalse(Rating.objects.exists())
+
+    def test_out_of_range_ids_are_rejected(self):
+        response = self.post_ratings(
+            {"course": self.python.pk, "student": 2**63, "rating": 5}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("student", response.json()["errors"]["0"])
+
+
+class NameCacheTests(SchoolTestCase):
+    def teachers(self):
+        return {row["Teacher"] for row in self.client.get("/api/course-stats/").json()}
+
+    def test_renamed_teacher_shows_up_in_cached_responses(self):
+        self.assertIn("Noor", self.teachers())
+
+        self.teacher.name = "Noor Ul Ain"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.teacher.save()
+
+        self.assertIn("Noor Ul Ain", self.teachers())
+        self.assertNotIn("Noor", self.teachers())
+
+    def test_names_are_invalidated_before_analytics(self):
+        calls = mock.Mock()
+        with mock.patch.object(signals, "invalidate_analytics", calls.analytics):
+            with mock.patch.object(signals.student_names, "invalidate", calls.names):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.students[0].save()
+
+        self.assertEqual(calls.mock_calls, [mock.call.names(), mock.call.analytics()])
+
+
+class RatedSchoolTestCase(SchoolTestCase):
+    @classmethod
+    def create_fixtures(cls):
+        super().create_fixtures()
+        s0, s1, s2, s3 = cls.students
+        cls.python.students.set([s0, s1, s2])
+        cls.django.students.set([s0, s1])
+        cls.react.students.set([s1, s3])
+        for course, student, rating in [
+            (cls.python, s0, 5),
+            (cls.python, s1, 4),
+            (cls.django, s0, 2),
+            (cls.react, s3, 5),
+            (cls.python, s2, 3),
+            (cls.django, s1, 4),
+            (cls.react, s1, 4),
+        ]:
+            Rating.objects.create(course=course, student=student, rating=rating, comment="")
+
+    def get_json(self, url):
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class AnalyticsFilterTests(RatedSchoolTestCase):
+    def titles(self, query):
+        return [row["title"] for row in self.get_json(f"/api/top-courses/{query}")]
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in [
+            "?min_avg=abc",
+            "?min_avg=6",
+            "?price_min=30&price_max=10",
+            "?limit=501",
+            "?limit=0",
+            f"?teacher_id={2**63}",
+        ]:
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/top-courses/{query}")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("errors", response.json())
+        self.assertEqual(self.client.get("/api/teacher-rating/?limit=501").status_code, 400)
+
+    def test_top_courses_filters(self):
+        self.assertEqual(self.titles(""), ["React from Zero", "Python Basics"])
+        self.assertEqual(
+            self.titles("?min_avg=2"), ["React from Zero", "Python Basics", "Django Mastery"]
+        )
+        self.assertEqual(self.titles("?min_reviews=3"), ["Python Basics"])
+        self.assertEqual(self.titles("?price_max=20"), ["Python Basics"])
+        self.assertEqual(self.titles("?price_min=10.01"), ["React from Zero"])
+        self.assertEqual(self.titles(f"?teacher_id={self.teacher.pk}"), ["Python Basics"])
+        self.assertEqual(self.titles("?limit=1"), ["React from Zero"])
+
+    def test_teacher_filters(self):
+        teacher_id = self.other_teacher.pk
+        rows = self.get_json(f"/api/teacher-courses/?teacher_id={teacher_id}")
+        self.assertEqual([row["Teacher name"] for row in rows], ["Ali Raza"])
+        rows = self.get_json(f"/api/teacher-rating/?teacher_id={teacher_id}")
+        self.assertEqual(rows, [{"Teacher": "Ali Raza", "Total Course": 2, "Average Rating": 4.5}])
+        self.assertEqual(len(self.get_json("/api/teacher-students/?limit=1")), 1)
+        self.assertEqual(len(self.get_json("/api/top-teacher-courses/?limit=1")), 1)
+
+    def test_equivalent_queries_share_a_cache_entry(self):
+        with mock.patch.object(views, "current_snapshot", return_value=(None, None)) as computed:
+            for query in [
+                "",
+                "?min_avg=3.50&min_reviews=2",
+                "?min_reviews=2&min_avg=3.5&unknown=1",
+            ]:
+                response = self.client.get(f"/api/top-courses/{query}")
+                self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(computed.call_count, 1)
+
+
+SNAPSHOT_URLS = [
+    "/api/top-courses/",
+    "/api/top-courses/?min_reviews=1&min_avg=2",
+    "/api/top-courses/?min_reviews=1&min_avg=0&price_min=10&price_max=30",
+    "/api/top-courses/?min_reviews=1&min_avg=0&limit=2",
+    "/api/course-stats/",
+    "/api/teacher-rating/",
+    "/api/teacher-rating/?limit=1",
+]
+
+
+class SnapshotTests(RatedSchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "analytics.snapshot")
+        for patcher in [
+            mock.patch.object(snapshot, "snapshot_reader", SnapshotReader(self.path)),
+            mock.patch.object(snapshot, "SNAPSHOT_CHECK_INTERVAL", 0),
+            mock.patch.object(SnapshotReader, "_schedule_rebuild"),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_snapshot_responses_match_the_database(self):
+        from_database = {url: self.get_json(url) for url in SNAPSHOT_URLS}
+        build_snapshot(self.path)
+
+        self.assertIsNotNone(current_snapshot()[0])
+        for url in SNAPSHOT_URLS:
+            with self.subTest(url=url):
+                self.assertEqual(self.get_json(url), from_database[url])
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.client.get("/api/top-courses/?min_reviews=1&min_avg=2")
+
+    def test_teacher_metrics(self):
+        build_snapshot(self.path)
+        teachers = {row["id"]: row for row in current_snapshot()[0].teachers}
+
+        noor = teachers[self.teacher.pk]
+        self.assertEqual(noor["reviews_count"], 5)
+        self.assertEqual(noor["student_count"], 3)
+        # The latest rating of all the teacher's courses is s1's Django one.
+        self.assertEqual(noor["latest_rating"], 4)
+        self.assertEqual(teachers[self.other_teacher.pk]["latest_rating"], 4)
+
+    def test_stale_snapshot_is_served_for_a_bounded_time(self):
+        build_snapshot(self.path)
+        before = self.get_json("/api/top-courses/?min_reviews=1&min_avg=0")
+        with self.captureOnCommitCallbacks(execute=True):
+            for rating in Rating.objects.filter(course=self.react):
+                rating.rating = 1
+                rating.save()
+
+        stale, max_age = current_snapshot()
+        self.assertIsNotNone(stale)
+        self.assertLessEqual(max_age, snapshot.ANALYTICS_SNAPSHOT_MAX_STALENESS)
+        response = self.client.get("/api/top-courses/?min_reviews=1&min_avg=0")
+        self.assertEqual(response.json(), before)
+
+        # Neither the snapshot nor the response cached from it outlive the bound.
+        later = time.time() + snapshot.ANALYTICS_SNAPSHOT_MAX_STALENESS
+        with mock.patch("time.time", return_value=later):
+            self.assertEqual(current_snapshot(), (None, None))
+            fresh = self.client.get("/api/top-courses/?min_reviews=1&min_avg=0").json()
+        self.assertNotEqual(fresh, before)
+
+
+    def test_file_swapped_while_opening_is_not_mixed_with_the_old_header(self):
+        build_snapshot(self.path)
+        expected = current_snapshot()[0].teachers.copy()
+        # A newer snapshot with a different layout.
+        for i in range(5):
+            Teacher.objects.create(name=f"Teacher {i}", bio="")
+        newer = os.path.join(os.path.dirname(self.path), "newer.snapshot")
+        build_snapshot(newer)
+
+        parse_header = snapshot._parse_header
+
+        def swap_after_parsing(*args):
+            header = parse_header(*args)
+            os.replace(newer, self.path)
+            return header
+
+        with mock.patch.object(snapshot, "_parse_header", swap_after_parsing):
+            opened = AnalyticsSnapshot(self.path)
+
+        self.assertEqual(opened.teachers.tolist(), expected.tolist())
+
+    def test_build_leaves_only_the_snapshot_file(self):
+        build_snapshot(self.path)
+        build_snapshot(self.path)
+
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["analytics.snapshot"])
+
+    def test_one_rebuild_at_a_time_and_not_right_after_a_build(self):
+        reader = SnapshotReader(self.path)
+        with mock.patch.object(snapshot, "connections"), mock.patch.object(
+            snapshot, "build_snapshot", wraps=build_snapshot
+        ) as build:
+            held = WorkerLock(snapshot.SNAPSHOT_REBUILD_LOCK_KEY, timeout=30)
+            self.assertTrue(held.acquire())
+            reader._rebuild()
+            self.assertEqual(build.call_count, 0)
+            held.release()
+
+            reader._rebuild()
+            self.assertEqual(build.call_count, 1)
+            # The file on disk was just built.
+            reader._rebuild()
+            self.assertEqual(build.call_count, 1)
+
+
+ANALYTICS_URLS = SNAPSHOT_URLS + [
+    "/api/teacher-courses/",
+    "/api/teacher-students/",
+    "/api/course-latest/",
+    "/api/top-teacher-courses/",
+    "/api/latest_rating/",
+]
+
+
+class RatingArchiveTests(RatedSchoolTestCase):
+    def archive(self, **options):
+        call_command("archive_ratings", stdout=StringIO(), **options)
+
+    def assertRollupsMatchArchive(self):
+        archived = {
+            row["course_id"]: row
+            for row in ArchivedRating.objects.values("course_id").annotate(
+                count=Count("id"), total=Sum("rating"), latest_id=Max("id")
+            )
+        }
+        for course in Course.objects.with_rating_stats().with_latest_rating():
+            row = archived.get(course.pk, {"count": 0, "total": 0, "latest_id": None})
+            live = Rating.objects.filter(course=course)
+            self.assertEqual(course.reviews_count, row["count"] + live.count())
+            self.assertEqual(
+                course.rating_sum, row["total"] + sum(live.values_list("rating", flat=True))
+            )
+            latest_ids = [row["latest_id"], *live.values_list("id", flat=True)]
+            latest_id = max((pk for pk in latest_ids if pk is not None), default=None)
+            latest = (
+                Rating.objects.filter(pk=latest_id).first()
+                or ArchivedRating.objects.filter(pk=latest_id).first()
+            )
+            self.assertEqual(course.latest_student_id, latest and latest.student_id)
+
+    def test_endpoints_are_unchanged_by_archiving(self):
+        before = {url: self.get_json(url) for url in ANALYTICS_URLS}
+        self.archive(before_id=Rating.objects.order_by("id")[4].id)
+
+        self.assertEqual(ArchivedRating.objects.count(), 4)
+        self.assertEqual(Rating.objects.count(), 3)
+        for url in ANALYTICS_URLS:
+            with self.subTest(url=url):
+                self.assertEqual(self.get_json(url), before[url])
+
+    def test_archiving_a_batch_invalidates_analytics_once(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            ArchivedRating.objects.archive(Rating.objects.all())
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Rating.objects.exists())
+        self.assertRollupsMatchArchive()
+
+    def test_a_rolled_back_change_does_not_swallow_the_next_invalidation(self):
+        first, second = Rating.objects.all()[:2]
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                first.save()
+                raise DatabaseError
+            second.save()
+
+        self.assertEqual(len(callbacks), 1)
+
+    def test_removing_archived_ratings_queries_each_table_once(self):
+        self.archive(before="2999-01-01")
+        with self.assertNumQueries(5):
+            ArchivedRating.objects.exclude(student=self.students[1]).remove()
+
+        self.assertEqual(
+            set(ArchivedRating.objects.values_list("student_id", flat=True)),
+            {self.students[1].pk},
+        )
+        self.assertRollupsMatchArchive()
+
+    def test_reposting_an_archived_pair_updates_it_in_place(self):
+        self.archive(archived_courses=True, before="2999-01-01")
+        student = self.students[0]
+        response = self.client.post(
+            "/api/ratings/",
+            json.dumps({"course": self.python.pk, "student": student.pk, "rating": 1}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            ArchivedRating.objects.filter(course=self.python, student=student).exists()
+        )
+        self.assertEqual(Rating.objects.get().rating, 1)
+        python = Course.objects.with_rating_stats().get(pk=self.python.pk)
+        self.assertEqual((python.reviews_count, python.rating_sum), (3, 1 + 4 + 3))
+        self.assertRollupsMatchArchive()
+
+    def test_deleting_a_student_takes_their_archived_ratings_out_of_the_rollups(self):
+        self.archive(before="2999-01-01")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[1].delete()
+
+        self.assertFalse(ArchivedRating.objects.filter(student_id=self.students[1].pk).exists())
+        self.assertRollupsMatchArchive()
+        self.assertNotIn(
+            self.students[1].name,
+            {row["latest_student"] for row in self.get_json("/api/latest_rating/")},
+        )
+
+
+class EnrollmentTests(SchoolTestCase):
+    def post_enrollments(self, payload):
+        return self.client.post(
+            "/api/enrollments/", json.dumps(payload), content_type="application/json"
+        )
+
+    def enrolled_pairs(self):
+        return set(Course.students.through.objects.values_list("course_id", "student_id"))
+
+    def test_enroll_and_unenroll_are_idempotent(self):
+        s0, s1 = self.students[:2]
+        pairs = [(self.python.pk, s0.pk), (self.python.pk, s1.pk), (self.react.pk, s0.pk)]
+
+        self.assertEqual(enroll(pairs + pairs[:1], batch_size=2), 3)
+        self.assertEqual(enroll(pairs, batch_size=2), 0)
+        self.assertEqual(self.enrolled_pairs(), set(pairs))
+        self.assertEqual(unenroll(pairs[:2], batch_size=1), 2)
+        self.assertEqual(unenroll(pairs[:2], batch_size=1), 0)
+        self.assertEqual(self.enrolled_pairs(), {pairs[2]})
+
+    def test_endpoint_counts_only_new_enrollments(self):
+        s0, s1, s2 = self.students[:3]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.students.add(s0, s2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post_enrollments(
+                {
+                    "enroll": [
+                        {"course": self.python.pk, "student": s0.pk},
+                        {"course": self.python.pk, "student": s1.pk},
+                    ],
+                    "unenroll": [{"course": self.python.pk, "student": s2.pk}],
+                }
+            )
+
+        self.assertEqual(response.json(), {"enrolled": 1, "unenrolled": 1})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            self.enrolled_pairs(), {(self.python.pk, s0.pk), (self.python.pk, s1.pk)}
+        )
+
+    def student_counts(self):
+        return {
+            row["Course Title"]: row["Total Enrolled Students"]
+            for row in self.client.get("/api/course-stats/").json()
+        }
+
+    def test_enrollment_updates_cached_student_counts(self):
+        self.assertEqual(self.student_counts()["React from Zero"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_enrollments(
+                {"enroll": [{"course": self.react.pk, "student": self.students[0].pk}]}
+            )
+
+        self.assertEqual(self.student_counts()["React from Zero"], 1)
+
+    def test_unknown_ids_are_rejected(self):
+        response = self.post_enrollments(
+            {"enroll": [{"course": 9999, "student": self.students[0].pk}]}
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["courses"], [9999])
+        self.assertEqual(self.enrolled_pairs(), set())
+
+    def test_out_of_range_ids_are_rejected(self):
+        pair = {"course": self.python.pk, "student": 2**63}
+        response = self.post_enrollments({"enroll": [pair], "unenroll": [pair]})
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertIn("student", errors["enroll"]["0"])
+        self.assertIn("student", errors["unenroll"]["0"])
+
+
+class WarmUpTests(RatedSchoolTestCase):
+    def test_warm_up_fills_the_caches(self):
+        with self.assertNoLogs("school.warmup", level="ERROR"):
+            warm_up()
+
+        self.assertIsNotNone(cache.get("school:analytics:course-stats"))
+        self.assertEqual(len(get_syllabi([self.python.pk, self.react.pk])[0]), 2)
+        # Served from the cache without touching the database.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/course-stats/").status_code, 200)
+
+
+class ProfilerTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        profiler = {"ENABLED": True, "SAMPLE_RATE": 0, "DIRECTORY": self.directory}
+        patcher = override_settings(SCHOOL_PROFILER=profiler)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def get(self, path, token=None):
+        headers = {"X-Profile-Token": token} if token else {}
+        response = self.client.get(path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def profiles(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.directory)
+            for root, _, names in os.walk(self.directory)
+            for name in names
+        )
+
+    def test_valid_token_writes_a_profile_per_route(self):
+        self.get("/api/course-stats/", make_profile_token())
+
+        [profile] = self.profiles()
+        self.assertEqual(os.path.dirname(profile), "api_course-stats")
+        self.assertTrue(profile.endswith(".prof"))
+
+    def test_bad_or_expired_token_writes_nothing(self):
+        two_hours_ago = time.time() - 2 * 60 * 60
+        with mock.patch("time.time", return_value=two_hours_ago):
+            expired = make_profile_token()
+
+        self.get("/api/course-stats/", "profile:forged:token")
+        self.get("/api/course-stats/", expired)
+        self.get("/api/course-stats/")
+        self.assertEqual(self.profiles(), [])
+
+    def test_profile_report_merges_each_route(self):
+        token = make_profile_token()
+        self.get("/api/course-stats/", token)
+        self.get("/api/course-stats/", token)
+        self.get("/api/top-courses/", token)
+
+        output = StringIO()
+        call_command("profile_report", directory=self.directory, clear=True, stdout=output)
+
+        report = output.getvalue()
+        self.assertIn("api_course-stats (2 profiled requests)", report)
+        self.assertIn("api_top-courses (1 profiled requests)", report)
+        self.assertIn("course_stats", report)
+        self.assertFalse([name for name in self.profiles() if name.endswith(".prof")])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+
+        def call():
+            results.append(flights.do("key", compute))
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to block on the leader's call.
+        threading.Event().wait(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 8)
+
+    def test_exception_is_shared_and_key_is_released(self):
+        flights = SingleFlight()
+        with self.assertRaises(ZeroDivisionError):
+            flights.do("key", lambda: 1 / 0)
+        self.assertEqual(flights.do("key", lambda: "again"), "again")
+
+
+class WorkerLockTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lock_file_is_exclusive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(locks, "SCHOOL_LOCK_DIR", directory):
+                first = WorkerLock("school:analytics:top-courses:lock", timeout=30)
+                second = WorkerLock("school:analytics:top-courses:lock", timeout=30)
+                self.assertTrue(first.acquire())
+                self.assertFalse(second.acquire())
+                first.release()
+                self.assertTrue(second.acquire())
+                second.release()
+
+    def test_cache_lock_is_only_released_by_its_owner(self):
+        first = WorkerLock("lock", timeout=30)
+        self.assertTrue(first.acquire())
+        # The lock expired and another worker took it.
+        cache.delete("lock")
+        second = WorkerLock("lock", timeout=30)
+        self.assertTrue(second.acquire())
+        first.release()
+        self.assertFalse(WorkerLock("lock", timeout=30).acquire())
+        second.release()
+        self.assertTrue(WorkerLock("lock", timeout=30).acquire())
+
+
+class CachedAnalyticsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_error_response_is_returned_without_running_the_view_again(self):
+        calls = []
+
+        @cached_analytics("failing")
+        def failing(request):
+            calls.append(1)
+            return JsonResponse({"error": "unavailable"}, status=503)
+
+        response = failing(RequestFactory().get("/"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.content, b'{"error": "unavailable"}')
+        self.assertEqual(len(calls), 1)
+        # Errors are not cached.
+        failing(RequestFactory().get("/"))
+        self.assertEqual(len(calls), 2)
+
+    def test_response_is_cached(self):
+        calls = []
+
+        @cached_analytics("counting")
+        def counting(request):
+            calls.append(1)
+            return JsonResponse({"calls": len(calls)})
+
+        for _ in range(3):
+            response = counting(RequestFactory().get("/"))
+        self.assertEqual(response.content, b'{"calls": 1}')
+        self.assertEqual(len(calls), 1)
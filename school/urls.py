@@ -7,7 +7,11 @@ from .views import (
     course_latest_summary,
     average_rating_per_teacher,
     topTwoCoursesOfEachTeacher,
-    latestRatingwithStudentName
+    latestRatingwithStudentName,
+    course_syllabus,
+    course_syllabus_catalogue,
+    submit_rating,
+    bulk_enrollment,
 )
 
 urlpatterns = [
@@ -19,4 +23,8 @@ urlpatterns = [
     path("teacher-rating/", average_rating_per_teacher),
     path('top-teacher-courses/', topTwoCoursesOfEachTeacher),
     path('latest_rating/', latestRatingwithStudentName),
+    path("courses/syllabus/", course_syllabus_catalogue),
+    path("courses/<int:course_id>/syllabus/", course_syllabus),
+    path("ratings/", submit_rating),
+    path("enrollments/", bulk_enrollment),
 ]
@@ -1,7 +1,18 @@
+import json
+import math
+
 from django.http import JsonResponse
-from django.db.models import OuterRef, Subquery
-from django.db.models import Avg, Count, F, Window
-from .models import Course, Teacher, Student, Rating
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_POST
+from django.db.models import Prefetch
+from django.db.models import Count, F, Window
+from .cache import cached_analytics, get_syllabi, set_syllabi
+from .dimensions import student_names, teacher_names
+from .forms import MAX_ID, EnrollmentForm, RatingForm, TeacherFilterForm, TopCoursesFilterForm
+from .models import Course, CourseMaterial, Lesson, Teacher, Student, Rating
+from .services import update_enrollments
+from .snapshot import current_snapshot
 from django.db.models.functions import RowNumber
 
 
@@ -10,13 +21,57 @@ Write a Django view that returns a list of all courses along with their average
 Only include courses that have at least 2 reviews and the average rating is greater than 3.5.
 The response should include the course title and its average rating.
 
+Query parameters (see TopCoursesFilterForm):
+    min_reviews (default 2), min_avg (default 3.5), teacher_id,
+    price_min, price_max, limit
+Results are ordered by average rating, best first.
+
+This view, course_stats and average_rating_per_teacher are served from the
+memory-mapped analytics snapshot (school.snapshot) when it is up to date, or
+at most ANALYTICS_SNAPSHOT_MAX_STALENESS old while it is being rebuilt.
+
 """
 
 
-def top_courses_with_average_rating(request):
-    top_courses = Course.objects.annotate(
-        reviews_count=Count("rating"), avg_rating=Avg("rating__rating")
-    ).filter(reviews_count__gte=2, avg_rating__gt=3.5)
+def _snapshot_response(result, max_age):
+    response = JsonResponse(result, safe=False)
+    if max_age is not None:
+        # The snapshot predates the latest write; cached_analytics keeps the
+        # response no longer than the snapshot may still be served.
+        patch_cache_control(response, max_age=max_age)
+    return response
+
+
+@cached_analytics("top-courses", form_class=TopCoursesFilterForm)
+def top_courses_with_average_rating(request, filters):
+    snapshot, max_age = current_snapshot()
+    if snapshot is not None:
+        courses = snapshot.top_courses(filters)
+        result = [
+            {"title": title, "average_rating": round(avg_rating, 2)}
+            for title, avg_rating in zip(
+                courses["title"].tolist(), courses["avg_rating"].tolist()
+            )
+        ]
+        return _snapshot_response(result, max_age)
+
+    courses = Course.objects.all()
+    if filters["teacher_id"] is not None:
+        courses = courses.filter(teacher_id=filters["teacher_id"])
+    if filters["price_min"] is not None:
+        courses = courses.filter(price__gte=filters["price_min"])
+    if filters["price_max"] is not None:
+        courses = courses.filter(price__lte=filters["price_max"])
+    top_courses = (
+        courses.with_rating_stats()
+        .filter(
+            reviews_count__gte=filters["min_reviews"],
+            avg_rating__gt=filters["min_avg"],
+        )
+        .order_by("-avg_rating", "id")
+    )
+    if filters["limit"] is not None:
+        top_courses = top_courses[: filters["limit"]]
     result = []
     for course in top_courses:
         result.append(
@@ -35,14 +90,28 @@ The response should include:
     Number of courses taught
     Number of unique students taught
 
+The teacher endpoints accept teacher_id and limit (see TeacherFilterForm).
+
 """
 
 
-def teacher_course_student_stats(request):
-    all_teacher_courses = Teacher.objects.annotate(
-        course_count=Count("course", distinct=True),
-        student_count=Count("course__students", distinct=True),
-    ).order_by("-student_count")
+def _filter_teachers(teachers, filters):
+    if filters["teacher_id"] is not None:
+        teachers = teachers.filter(pk=filters["teacher_id"])
+    if filters["limit"] is not None:
+        teachers = teachers[: filters["limit"]]
+    return teachers
+
+
+@cached_analytics("teacher-courses", form_class=TeacherFilterForm)
+def teacher_course_student_stats(request, filters):
+    all_teacher_courses = _filter_teachers(
+        Teacher.objects.annotate(
+            course_count=Count("course", distinct=True),
+            student_count=Count("course__students", distinct=True),
+        ).order_by("-student_count", "id"),
+        filters,
+    )
     result = []
     for teacher in all_teacher_courses:
         result.append(
@@ -79,9 +148,10 @@ For example:
 """
 
 
-def teachers_with_top_students(request):
+@cached_analytics("teacher-students", form_class=TeacherFilterForm)
+def teachers_with_top_students(request, filters):
     result = []
-    for teacher in Teacher.objects.all():
+    for teacher in _filter_teachers(Teacher.objects.order_by("id"), filters):
         teacher_courses = Course.objects.filter(teacher=teacher)
         student_courses_count = (
             Student.objects.filter(courses__in=teacher_courses)
@@ -125,18 +195,43 @@ Output Should be liked:
 """
 
 
+@cached_analytics("course-stats")
 def course_stats(request):
-    stats = Course.objects.select_related("teacher").annotate(
-        avg_rating=Avg("rating__rating"), student_count=Count("students", distinct=True)
+    snapshot, max_age = current_snapshot()
+    if snapshot is not None:
+        courses = snapshot.courses
+        teachers = teacher_names.resolve(courses["teacher_id"].tolist())
+        result = [
+            {
+                "Course Title": title,
+                "Teacher": teachers.get(teacher_id),
+                "Average Rating": 0 if math.isnan(avg_rating) else avg_rating,
+                "Total Enrolled Students": student_count,
+            }
+            for title, teacher_id, avg_rating, student_count in zip(
+                courses["title"].tolist(),
+                courses["teacher_id"].tolist(),
+                courses["avg_rating"].tolist(),
+                courses["student_count"].tolist(),
+            )
+        ]
+        return _snapshot_response(result, max_age)
+
+    stats = (
+        Course.objects.with_rating_stats()
+        .annotate(student_count=Count("students", distinct=True))
+        .values("title", "teacher_id", "avg_rating", "student_count")
     )
+    stats = list(stats)
+    teachers = teacher_names.resolve(stat["teacher_id"] for stat in stats)
     result = []
     for stat in stats:
         result.append(
             {
-                "Course Title": stat.title,
-                "Teacher": stat.teacher.name,
-                "Average Rating": stat.avg_rating or 0,
-                "Total Enrolled Students": stat.student_count,
+                "Course Title": stat["title"],
+                "Teacher": teachers.get(stat["teacher_id"]),
+                "Average Rating": stat["avg_rating"] or 0,
+                "Total Enrolled Students": stat["student_count"],
             }
         )
 
@@ -167,18 +262,19 @@ Example:
 """
 
 
+@cached_analytics("course-latest")
 def course_latest_summary(request):
     result = []
-    latest_rating = Rating.objects.filter(course=OuterRef("pk")).order_by("-id")
-    courses = Course.objects.select_related("teacher").annotate(
-        latest_rating=Subquery(latest_rating.values("rating")[:1])
+    courses = list(
+        Course.objects.with_latest_rating().values("title", "teacher_id", "latest_rating")
     )
+    teachers = teacher_names.resolve(course["teacher_id"] for course in courses)
     for course in courses:
         result.append(
             {
-                "Course Title": course.title,
-                "Teacher": course.teacher.name,
-                "Latest Rating": course.latest_rating,
+                "Course Title": course["title"],
+                "Teacher": teachers.get(course["teacher_id"]),
+                "Latest Rating": course["latest_rating"],
             }
         )
     return JsonResponse(result, safe=False)
@@ -208,17 +304,40 @@ Example Output:
 """
 
 
-def average_rating_per_teacher(request):
+@cached_analytics("teacher-rating", form_class=TeacherFilterForm)
+def average_rating_per_teacher(request, filters):
+    snapshot, max_age = current_snapshot()
+    if snapshot is not None:
+        teachers = snapshot.teachers_matching(filters)
+        names = teacher_names.resolve(teachers["id"].tolist())
+        result = [
+            {
+                "Teacher": names.get(pk),
+                "Total Course": total_course,
+                "Average Rating": round(0 if math.isnan(avg_rating) else avg_rating, 2),
+            }
+            for pk, total_course, avg_rating in zip(
+                teachers["id"].tolist(),
+                teachers["total_course"].tolist(),
+                teachers["avg_rating"].tolist(),
+            )
+        ]
+        return _snapshot_response(result, max_age)
+
     result = []
-    teacher_ratings = Teacher.objects.annotate(
-        total_course=Count("course"), average_rating=Avg("course__rating__rating")
+    teachers = list(
+        _filter_teachers(Teacher.objects.order_by("id"), filters).values_list("id", "name")
     )
-    for teacher in teacher_ratings:
+    stats = Course.objects.filter(
+        teacher_id__in=[pk for pk, _ in teachers]
+    ).teacher_rating_stats()
+    for pk, name in teachers:
+        total_course, _, average_rating = stats.get(pk, (0, 0, None))
         result.append(
             {
-                "Teacher": teacher.name,
-                "Total Course": teacher.total_course,
-                "Average Rating": round(teacher.average_rating or 0, 2),
+                "Teacher": name,
+                "Total Course": total_course,
+                "Average Rating": round(average_rating or 0, 2),
             }
         )
 
@@ -241,10 +360,13 @@ Imagine this output of queryset so that we can make our JSON according to that
 """
 
 
-def topTwoCoursesOfEachTeacher(request):
+@cached_analytics("top-teacher-courses", form_class=TeacherFilterForm)
+def topTwoCoursesOfEachTeacher(request, filters):
     result = []
+    teacher_ids = _filter_teachers(Teacher.objects.order_by("id"), filters).values("id")
     top_courses = (
-        Course.objects.annotate(student_count=Count("students", distinct=True))
+        Course.objects.filter(teacher_id__in=teacher_ids)
+        .annotate(student_count=Count("students", distinct=True))
         .annotate(
             row_number=Window(
                 expression=RowNumber(),
@@ -253,11 +375,11 @@ def topTwoCoursesOfEachTeacher(request):
             )
         )
         .filter(row_number__lte=2)
-        .select_related("teacher")
-        .values("teacher_id", "teacher__name", "title", "student_count", "row_number")
+        .values("teacher_id", "title", "student_count", "row_number")
         .order_by("teacher_id", "row_number")
     )
-    print(top_courses)
+    top_courses = list(top_courses)
+    teachers = teacher_names.resolve(row["teacher_id"] for row in top_courses)
 
     result = []
     current_teacher = None
@@ -271,7 +393,7 @@ def topTwoCoursesOfEachTeacher(request):
                 result.append(group)
             current_teacher = row["teacher_id"]  # New teacher recorded
             group = {
-                "teacher": row["teacher__name"],
+                "teacher": teachers.get(row["teacher_id"]),
                 "top_courses": [],
             }  # New group created
 
@@ -294,10 +416,249 @@ For each course, find the latest rating (based on id) and the student name who g
 """
 
 
+@cached_analytics("latest-rating")
 def latestRatingwithStudentName(request):
-    latest_rating = Rating.objects.filter(course=OuterRef("pk")).order_by("-id")
-    qs = Course.objects.annotate(
-        latest_rating=Subquery(latest_rating.values("rating")[:1]),
-        latest_student=Subquery(latest_rating.values("student__name")[:1]),
-    ).values("id", "title", "latest_rating", "latest_student")
-    return JsonResponse(list(qs), safe=False)
+    qs = list(
+        Course.objects.with_latest_rating().values(
+            "id", "title", "latest_rating", "latest_student_id"
+        )
+    )
+    students = student_names.resolve(row["latest_student_id"] for row in qs)
+    result = [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "latest_rating": row["latest_rating"],
+            "latest_student": students.get(row["latest_student_id"]),
+        }
+        for row in qs
+    ]
+    return JsonResponse(result, safe=False)
+
+
+"""
+Return the syllabus of a course: its lessons in order, the materials attached to
+each lesson and the total duration of the course in minutes.
+
+The bulk catalogue variant returns the same payload for many courses at once
+(all of them, or the ones listed in ``?ids=1,2,3``). Both use narrowed Prefetch
+querysets so any number of courses is loaded in three queries:
+courses, lessons, materials. Rendered syllabi are cached per course.
+
+{
+  "id": 1,
+  "title": "Django Mastery",
+  "total_duration_minutes": 240,
+  "lessons": [
+    {
+      "id": 1,
+      "title": "Django Mastery – Lesson 1",
+      "duration_minutes": 60,
+      "materials": [
+        {"id": 1, "material_type": "video", "link": "https://..."}
+      ]
+    }
+  ]
+}
+"""
+
+
+def _build_syllabi(course_ids):
+    courses = (
+        Course.objects.filter(pk__in=course_ids)
+        .only("id", "title")
+        .prefetch_related(
+            Prefetch(
+                "lesson_set",
+                queryset=Lesson.objects.only(
+                    "id", "title", "duration_minutes", "course_id"
+                ).order_by("id"),
+            ),
+            Prefetch(
+                "lesson_set__coursematerial_set",
+                queryset=CourseMaterial.objects.only(
+                    "id", "material_type", "link", "lesson_id"
+                ).order_by("id"),
+            ),
+        )
+    )
+    syllabi = {}
+    for course in courses:
+        lessons = [
+            {
+                "id": lesson.id,
+                "title": lesson.title,
+                "duration_minutes": lesson.duration_minutes,
+                "materials": [
+                    {
+                        "id": material.id,
+                        "material_type": material.material_type,
+                        "link": material.link,
+                    }
+                    for material in lesson.coursematerial_set.all()
+                ],
+            }
+            for lesson in course.lesson_set.all()
+        ]
+        syllabi[course.id] = {
+            "id": course.id,
+            "title": course.title,
+            "total_duration_minutes": sum(
+                lesson["duration_minutes"] for lesson in lessons
+            ),
+            "lessons": lessons,
+        }
+    return syllabi
+
+
+def _load_syllabi(course_ids):
+    syllabi, generations = get_syllabi(course_ids)
+    missing = [pk for pk in course_ids if pk not in syllabi]
+    if missing:
+        built = _build_syllabi(missing)
+        set_syllabi(built, generations)
+        syllabi.update(built)
+    return syllabi
+
+
+def course_syllabus(request, course_id):
+    if course_id > MAX_ID:
+        return JsonResponse({"error": "Course not found"}, status=404)
+    syllabus = _load_syllabi([course_id]).get(course_id)
+    if syllabus is None:
+        return JsonResponse({"error": "Course not found"}, status=404)
+    return JsonResponse(syllabus)
+
+
+def course_syllabus_catalogue(request):
+    ids = request.GET.get("ids")
+    if ids:
+        try:
+            course_ids = list(dict.fromkeys(int(pk) for pk in ids.split(",")))
+            if not all(0 < pk <= MAX_ID for pk in course_ids):
+                raise ValueError
+        except ValueError:
+            return JsonResponse(
+                {"error": "ids must be a comma separated list of course ids"},
+                status=400,
+            )
+    else:
+        course_ids = list(Course.objects.order_by("id").values_list("id", flat=True))
+    syllabi = _load_syllabi(course_ids)
+    result = [syllabi[pk] for pk in course_ids if pk in syllabi]
+    return JsonResponse(result, safe=False)
+
+
+def _unknown_ids(course_ids, student_ids):
+    """Error payload for course or student ids that do not exist, else None."""
+    missing_courses = course_ids - set(
+        Course.objects.filter(pk__in=course_ids).values_list("pk", flat=True)
+    )
+    missing_students = student_ids - set(
+        Student.objects.filter(pk__in=student_ids).values_list("pk", flat=True)
+    )
+    if missing_courses or missing_students:
+        return {
+            "error": "Unknown course or student",
+            "courses": sorted(missing_courses),
+            "students": sorted(missing_students),
+        }
+    return None
+
+
+"""
+Submit ratings for courses. A student has at most one rating per course, so
+re-submitting updates the existing rating in place.
+
+POST /api/ratings/
+{"course": 1, "student": 3, "rating": 5, "comment": "Great course"}
+
+or a list of such objects to upsert a whole batch. Responds with the ids of
+the stored ratings, or 400 with the errors of each invalid row.
+"""
+
+
+@csrf_exempt
+@require_POST
+def submit_rating(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    rows = data if isinstance(data, list) else [data]
+    if not rows or not all(isinstance(row, dict) for row in rows):
+        return JsonResponse(
+            {"error": "Request body must be a JSON object or a list of objects"},
+            status=400,
+        )
+
+    forms = [RatingForm(row) for row in rows]
+    errors = {index: form.errors for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+    ratings = [form.to_rating() for form in forms]
+
+    unknown = _unknown_ids(
+        {rating.course_id for rating in ratings},
+        {rating.student_id for rating in ratings},
+    )
+    if unknown:
+        return JsonResponse(unknown, status=400)
+
+    ratings = Rating.objects.bulk_upsert(ratings)
+    return JsonResponse({"ids": [rating.id for rating in ratings]})
+
+
+"""
+Enroll and unenroll students in bulk.
+
+POST /api/enrollments/
+{
+  "enroll": [{"course": 1, "student": 3}, {"course": 1, "student": 4}],
+  "unenroll": [{"course": 2, "student": 3}]
+}
+
+Both lists are optional. Enrollments are written straight to the
+Course.students through table in batches; already enrolled pairs are ignored.
+Responds with the number of enrollments created and of enrollments removed.
+"""
+
+
+@csrf_exempt
+@require_POST
+def bulk_enrollment(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Request body must be a JSON object"}, status=400)
+
+    pairs = {}
+    errors = {}
+    for action in ("enroll", "unenroll"):
+        rows = data.get(action, [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return JsonResponse(
+                {"error": f"{action} must be a list of objects"}, status=400
+            )
+        forms = [EnrollmentForm(row) for row in rows]
+        action_errors = {
+            index: form.errors for index, form in enumerate(forms) if not form.is_valid()
+        }
+        if action_errors:
+            errors[action] = action_errors
+        else:
+            pairs[action] = [form.to_pair() for form in forms]
+    if errors:
+        return JsonResponse({"errors": errors}, status=400)
+
+    unknown = _unknown_ids(
+        {course_id for course_id, _ in pairs["enroll"]},
+        {student_id for _, student_id in pairs["enroll"]},
+    )
+    if unknown:
+        return JsonResponse(unknown, status=400)
+
+    enrolled, unenrolled = update_enrollments(pairs["enroll"], pairs["unenroll"])
+    return JsonResponse({"enrolled": enrolled, "unenrolled": unenrolled})
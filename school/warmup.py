@@ -0,0 +1,63 @@
+import logging
+import time
+from importlib import import_module
+from threading import Barrier
+
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+
+logger = logging.getLogger(__name__)
+
+
+def open_connections():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def warm_up():
+    """
+    Prepare a freshly started worker so its first /api/ request is served at
+    normal latency: import the URLconf and views, open the database
+    connections, load the teacher and student name caches, map the analytics
+    snapshot and fill the analytics and syllabus caches by calling every
+    parameterless /api/ view once.
+    """
+    from .dimensions import student_names, teacher_names
+    from .snapshot import current_snapshot
+
+    started = time.perf_counter()
+    import_module(settings.ROOT_URLCONF)
+    school_urls = import_module("school.urls")
+    open_connections()
+    teacher_names.load()
+    student_names.load()
+    current_snapshot()
+
+    factory = RequestFactory()
+    for pattern in school_urls.urlpatterns:
+        if pattern.pattern.converters:
+            continue
+        path = f"/api/{pattern.pattern}"
+        try:
+            pattern.callback(factory.get(path))
+        except Exception:
+            logger.exception("Warm-up request to %s failed", path)
+
+    logger.info("Warm-up finished in %.1f ms", (time.perf_counter() - started) * 1000)
+
+
+def warm_up_thread_pool(executor, size):
+    """
+    Open a database connection in each thread of ``executor``. Django keeps
+    one connection per thread, so threaded workers need this on top of
+    ``warm_up()``. The barrier pins one task to each of the ``size`` threads.
+    """
+    barrier = Barrier(size)
+
+    def task():
+        barrier.wait(timeout=30)
+        open_connections()
+
+    for future in [executor.submit(task) for _ in range(size)]:
+        future.result()